@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Batch processing of image files with lab.Image filters
+
+Takes a directory of PNG files (or a manifest file listing image paths, one
+per line) and a filter spec, runs the filters on every image in a pool of
+worker processes and writes every result into the output directory as soon
+as it is ready.  Per-image latency percentiles and throughput are reported
+at the end.
+
+A filter spec is a comma separated chain of filters applied in order:
+    invert, blur:n, sharpen:n, edges, retarget:n, seam:n
+
+Invoked as, for example:
+    python3 batch.py test_images out --filters blur:3,edges --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image as PILImage
+
+import lab
+
+# filter spec name: (Image method, number of integer arguments)
+FILTERS = {'invert': ('inverted', 0),
+           'blur': ('blurred', 1),
+           'sharpen': ('sharpened', 1),
+           'edges': ('edges', 0),
+           'retarget': ('retarget', 1),
+           'seam': ('seam_carving', 1)}
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+def parse_spec(spec):
+    """
+    Return list of (method name, args) for the filter spec
+    """
+    steps = []
+    for item in spec.split(','):
+        name, *args = item.strip().split(':')
+        if name not in FILTERS or len(args) != FILTERS[name][1]:
+            raise ValueError('Invalid filter: %r' % item)
+        steps.append((FILTERS[name][0], tuple(int(i) for i in args)))
+    return steps
+
+
+def list_images(source):
+    """
+    Return list of image paths from a directory or a manifest file.  Paths
+    in the manifest are relative to it; empty lines and # comments are
+    skipped
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source, fname) for fname in sorted(os.listdir(source))
+                if fname.lower().endswith(IMAGE_EXTENSIONS)]
+    base = os.path.dirname(source)
+    with open(source) as f:
+        lines = (line.split('#', 1)[0].strip() for line in f)
+        return [os.path.join(base, line) for line in lines if line]
+
+
+def output_names(sources):
+    """
+    Return list of PNG file names for the results of sources, named after
+    them.  Names which are already taken (by a.png and b/a.jpg, for example)
+    get a number: a.png, a-2.png
+    """
+    names = []
+    taken = set()
+    for source in sources:
+        stem = os.path.splitext(os.path.basename(source))[0]
+        name, n = stem + '.png', 1
+        # case-insensitive file systems would overwrite A.png with a.png
+        while name.lower() in taken:
+            n += 1
+            name = '%s-%d.png' % (stem, n)
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+
+def load_image(source):
+    """
+    Return lab.Image of the file.  Modes lab.Image.load does not support,
+    like the palette of every GIF file, are converted to RGB first
+    """
+    with open(source, 'rb') as f:
+        img = PILImage.open(f)
+        if img.mode not in ('L', 'LA') and not img.mode.startswith('RGB'):
+            img = img.convert('RGB')
+            return lab.Image(img.width, img.height, lab._gray_from_rgb(img.tobytes(), 3))
+    return lab.Image.load(source)
+
+
+def process_image(task):
+    """
+    Load image, apply the filter steps and save the result.  Return
+    (source, number of pixels, seconds)
+    """
+    source, target, steps = task
+    start = time.perf_counter()
+    img = load_image(source)
+    pixels = img.width * img.height
+    for name, args in steps:
+        img = getattr(img, name)(*args)
+    img.save(target)
+    return source, pixels, time.perf_counter() - start
+
+
+def percentile(values, p):
+    """
+    Return p-th percentile (nearest rank) of sorted values
+    """
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def run_batch(sources, out_dir, steps, workers=None, progress=None):
+    """
+    Process image files in a pool of workers and save results to out_dir
+    under their own names (see output_names).  Return dict of statistics
+
+    An image which fails does not stop the batch: of all images, succeeded
+    counts the written ones, failed the others and failures lists their
+    (source, error message).  progress, if given, is called with (done, total, source,
+    seconds) after every image, seconds being None for a failed one.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    sources = list(sources)
+    tasks = [(source, os.path.join(out_dir, name), steps)
+             for source, name in zip(sources, output_names(sources))]
+    latencies = []
+    pixels = 0
+    failures = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_image, task): task[0] for task in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                source, count, seconds = future.result()
+            except Exception as e:
+                failures.append((futures[future], '%s: %s' % (type(e).__name__, e)))
+                if progress is not None:
+                    progress(done, len(tasks), futures[future], None)
+                continue
+            latencies.append(seconds)
+            pixels += count
+            if progress is not None:
+                progress(done, len(tasks), source, seconds)
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {'images': len(tasks),
+            'succeeded': len(latencies),
+            'failed': len(failures),
+            'failures': sorted(failures),
+            'seconds': wall,
+            'images_per_second': len(latencies) / wall if wall else 0.0,
+            'megapixels_per_second': pixels / 1e6 / wall if wall else 0.0,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('source', help='directory of images or manifest file')
+    parser.add_argument('out_dir', help='directory for the results')
+    parser.add_argument('--filters', required=True,
+                        help='filter spec, e.g. invert,blur:3,seam:20')
+    parser.add_argument('--workers', type=int, help='number of worker processes')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args()
+    try:
+        steps = parse_spec(args.filters)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def progress(done, total, source, seconds):
+        result = 'failed' if seconds is None else '%.3f s' % seconds
+        print('[%d/%d] %s %s' % (done, total, source, result), file=sys.stderr)
+
+    stats = run_batch(list_images(args.source), args.out_dir, steps, args.workers,
+                      None if args.quiet else progress)
+    print('%d of %d images in %.2f s: %.2f images/s, %.2f MP/s, %d failed'
+          % (stats['succeeded'], stats['images'], stats['seconds'],
+             stats['images_per_second'], stats['megapixels_per_second'], stats['failed']))
+    print('latency p50 %.3f s, p90 %.3f s, p99 %.3f s, max %.3f s'
+          % (stats['p50'], stats['p90'], stats['p99'], stats['max']))
+    for source, error in stats['failures']:
+        print('failed %s: %s' % (source, error), file=sys.stderr)
+    if stats['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
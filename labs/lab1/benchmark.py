@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite of the lab.Image filters
+
+Runs correlate, blurred, sharpened, edges, retarget and seam_carving on
+synthetic images of several sizes (64x64 up to 4096x4096), sweeping the
+kernel sizes.  For every case the best wall time, peak memory (traced by
+tracemalloc in a separate run) and pixels per second are recorded into a
+JSON report.  Two reports, e.g. from two commits, can be compared and
+regressions above a threshold are reported with a non-zero exit status.
+
+Invoked as, for example:
+    python3 benchmark.py run --sizes 64,256,1024 --output new.json
+    python3 benchmark.py compare old.json new.json --threshold 0.1
+    python3 benchmark.py direct --size 200 --repeat 3
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import lab
+
+SIZES = (64, 128, 256, 512, 1024, 2048, 4096)
+KERNEL_SIZES = (3, 5, 9, 15)
+# seams removed by retarget and seam_carving
+SEAMS = 4
+# seam operations are skipped on larger images unless asked for
+MAX_CARVE_SIZE = 1024
+# operation: (function of (image, kernel size), uses kernel size)
+OPERATIONS = {'correlate': (lambda img, n: img.correlate(general_kernel(n)), True),
+              'blurred': (lambda img, n: img.blurred(n), True),
+              'sharpened': (lambda img, n: img.sharpened(n), True),
+              'edges': (lambda img, n: img.edges(), False),
+              'retarget': (lambda img, n: img.retarget(SEAMS), False),
+              'seam_carving': (lambda img, n: img.seam_carving(SEAMS), False)}
+REPORT_VERSION = 1
+
+
+def make_image(width, height, seed=0):
+    """
+    Create an image of random 8-bit pixels
+    """
+    rng = random.Random(seed)
+    return lab.Image(width, height, bytearray(rng.randbytes(width * height)))
+
+
+def general_kernel(n, seed=1):
+    """
+    Return n x n kernel of random weights, which takes the general path of
+    Image.correlate
+    """
+    rng = random.Random(seed)
+    return [[rng.uniform(-1, 1) for _ in range(n)] for _ in range(n)]
+
+
+def sample_kernels():
+    """
+    Return dict of kernels to benchmark
+    """
+    return {'box_3': lab.create_blur_kernel(3),
+            'box_9': lab.create_blur_kernel(9),
+            'sharpen_5': lab.create_sharpen_kernel(5),
+            'sobel_x': lab.SOBEL_X,
+            'general_5': general_kernel(5)}
+
+
+def best_time(func, repeat):
+    """
+    Return the best wall time of repeat calls of func
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func):
+    """
+    Return peak bytes allocated during a call of func
+    """
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def case_name(operation, size, n=None):
+    """
+    Return name identifying a benchmark case in reports
+    """
+    if n is None:
+        return '%s %dx%d' % (operation, size, size)
+    return '%s(%d) %dx%d' % (operation, n, size, size)
+
+
+def benchmark_cases(sizes=SIZES, kernel_sizes=KERNEL_SIZES, operations=None,
+                    max_carve_size=MAX_CARVE_SIZE):
+    """
+    Yield (name, operation, size, kernel size or None) of benchmark cases
+    """
+    for size in sizes:
+        for operation in operations or OPERATIONS:
+            if operation in ('retarget', 'seam_carving') and size > max_carve_size:
+                continue
+            if OPERATIONS[operation][1]:
+                for n in kernel_sizes:
+                    yield case_name(operation, size, n), operation, size, n
+            else:
+                yield case_name(operation, size), operation, size, None
+
+
+def run_suite(cases, repeat=3, memory=True, progress=None):
+    """
+    Run benchmark cases.  Return report dict
+
+    progress, if given, is called with the result of every case.
+    """
+    results = []
+    img = None
+    for name, operation, size, n in cases:
+        if img is None or img.width != size:
+            img = make_image(size, size)
+        func = OPERATIONS[operation][0]
+        seconds = best_time(lambda: func(img, n), repeat)
+        result = {'name': name,
+                  'operation': operation,
+                  'size': size,
+                  'kernel': n,
+                  'seconds': seconds,
+                  'pixels_per_second': size * size / seconds if seconds else 0.0,
+                  'peak_bytes': peak_memory(lambda: func(img, n)) if memory else None}
+        results.append(result)
+        if progress is not None:
+            progress(result)
+    return {'version': REPORT_VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'results': results}
+
+
+def compare_reports(old, new, threshold=0.1, memory_threshold=0.1, min_seconds=0.001):
+    """
+    Return list of (name, metric, old value, new value) of regressions of
+    the new report against the old one
+
+    Time regresses when it grows by more than threshold (a fraction) and is
+    at least min_seconds, peak memory when it grows by more than
+    memory_threshold.  Cases present in only one report are ignored.
+    """
+    before = {result['name']: result for result in old['results']}
+    regressions = []
+    for result in new['results']:
+        reference = before.get(result['name'])
+        if reference is None:
+            continue
+        if (result['seconds'] >= min_seconds
+                and result['seconds'] > reference['seconds'] * (1 + threshold)):
+            regressions.append((result['name'], 'seconds',
+                                reference['seconds'], result['seconds']))
+        if (result['peak_bytes'] is not None and reference['peak_bytes'] is not None
+                and result['peak_bytes'] > reference['peak_bytes'] * (1 + memory_threshold)):
+            regressions.append((result['name'], 'peak_bytes',
+                                reference['peak_bytes'], result['peak_bytes']))
+    return regressions
+
+
+def load_report(fname):
+    """
+    Return report read from JSON file
+    """
+    with open(fname) as f:
+        report = json.load(f)
+    if report.get('version') != REPORT_VERSION:
+        raise ValueError('Unsupported report version: %r' % report.get('version'))
+    return report
+
+
+def _int_list(text):
+    return tuple(int(i) for i in text.split(','))
+
+
+def run_main(args):
+    def progress(result):
+        memory = ('%10.1f MB' % (result['peak_bytes'] / 1e6)
+                  if result['peak_bytes'] is not None else '%13s' % '-')
+        print('%-28s %10.4f s %12.0f px/s %s'
+              % (result['name'], result['seconds'], result['pixels_per_second'], memory),
+              file=sys.stderr)
+
+    operations = args.operations.split(',') if args.operations else None
+    for operation in operations or ():
+        if operation not in OPERATIONS:
+            raise SystemExit('Unknown operation: %r' % operation)
+    cases = benchmark_cases(args.sizes, args.kernels, operations, args.max_carve_size)
+    report = run_suite(cases, args.repeat, not args.no_memory, progress)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1, sort_keys=True)
+        f.write('\n')
+
+
+def compare_main(args):
+    old, new = load_report(args.old), load_report(args.new)
+    regressions = compare_reports(old, new, args.threshold, args.memory_threshold,
+                                  args.min_seconds)
+    for name, metric, before, after in regressions:
+        print('%-28s %-10s %14.4g -> %14.4g (%+.1f%%)'
+              % (name, metric, before, after, 100 * (after / before - 1) if before else 0))
+    if regressions:
+        sys.exit(1)
+    print('No regressions')
+
+
+def direct_main(args):
+    img = make_image(args.size, args.size)
+    megapixels = img.width * img.height / 1e6
+    print('%-10s %14s %14s %8s' % ('kernel', 'before s/MP', 'after s/MP', 'speedup'))
+    for name, kernel in sample_kernels().items():
+        before = best_time(lambda: img._correlate_direct(kernel), args.repeat)
+        after = best_time(lambda: img.correlate(kernel), args.repeat)
+        print('%-10s %14.3f %14.3f %7.1fx' % (name, before / megapixels,
+                                              after / megapixels, before / after))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the suite and write a JSON report')
+    run.add_argument('--sizes', type=_int_list, default=SIZES,
+                     help='comma separated widths (and heights) of the images')
+    run.add_argument('--kernels', type=_int_list, default=KERNEL_SIZES,
+                     help='comma separated kernel sizes')
+    run.add_argument('--operations', help='comma separated operations, default all of '
+                     + ','.join(OPERATIONS))
+    run.add_argument('--max-carve-size', type=int, default=MAX_CARVE_SIZE,
+                     help='largest size for retarget and seam_carving')
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--no-memory', action='store_true', help='do not trace peak memory')
+    run.add_argument('--output', default='benchmark.json', help='report file')
+    run.set_defaults(func=run_main)
+
+    compare = commands.add_parser('compare', help='report regressions between reports')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=0.1,
+                         help='allowed relative growth of the time')
+    compare.add_argument('--memory-threshold', type=float, default=0.1,
+                         help='allowed relative growth of the peak memory')
+    compare.add_argument('--min-seconds', type=float, default=0.001,
+                         help='times below this are too noisy to compare')
+    compare.set_defaults(func=compare_main)
+
+    direct = commands.add_parser('direct', help='compare Image.correlate with the '
+                                 'direct per-pixel correlation')
+    direct.add_argument('--size', type=int, default=200,
+                        help='width and height of the synthetic image')
+    direct.add_argument('--repeat', type=int, default=3)
+    direct.set_defaults(func=direct_main)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
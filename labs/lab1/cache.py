@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of lab.Image filter results
+
+Results are keyed by a hash of the source image (width, height and pixel
+values) together with the name of the Image method and its arguments.
+There are two tiers: an in-memory LRU of packed results and an optional
+directory of compact binary files, which are memory-mapped on read.  Both
+are bounded in bytes and evict the least recently used entries.
+
+seam_carving results are also stored every checkpoint seams, so carving
+more seams from the same image later resumes from the largest cached
+intermediate instead of starting over.
+
+Invoked as, for example:
+    results = cache.ResultCache('/tmp/lab1-cache')
+    edges = results.apply(img, 'edges')
+    carved = results.seam_carving(img, 100)
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+
+import lab
+
+# magic, width, height, memoryview format of the pixels
+HEADER = struct.Struct('<4sIIc')
+MAGIC = b'LIMG'
+SUFFIX = '.img'
+
+
+def _packed(image):
+    """
+    Return (format, bytes) of the image pixels in compact form
+    """
+    pixels = image.pixels
+    if not isinstance(pixels, (bytearray, memoryview)):
+        pixels = lab._compact(pixels)
+    if isinstance(pixels, bytearray):
+        return 'B', bytes(pixels)
+    if isinstance(pixels, memoryview):
+        return pixels.format, pixels.tobytes()
+    # integers beyond 64 bits
+    return 'r', repr(pixels).encode()
+
+
+def _unpacked(width, height, fmt, data):
+    """
+    Return image from its packed form (see _packed)
+    """
+    if fmt == 'r':
+        pixels = [int(c) for c in bytes(data).decode()[1:-1].split(',') if c.strip()]
+    else:
+        # read-only view of the packed data, which Image.set_pixel widens
+        pixels = memoryview(data).cast('B').cast(fmt)
+    return lab.Image(width, height, pixels)
+
+
+def image_digest(image):
+    """
+    Return hex digest identifying the image contents
+    """
+    fmt, data = _packed(image)
+    h = hashlib.sha256(HEADER.pack(MAGIC, image.width, image.height, fmt.encode()))
+    h.update(data)
+    return h.hexdigest()
+
+
+def result_key(digest, name, args):
+    """
+    Return cache key of the Image method name called with args on the image
+    with the digest
+    """
+    return hashlib.sha256(('%s:%s%r' % (digest, name, tuple(args))).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier (memory and disk) LRU cache of Image filter results
+
+    directory=None disables the disk tier.  stats counts memory_hits,
+    disk_hits, misses and evictions.
+    """
+    def __init__(self, directory=None, memory_bytes=64 << 20, disk_bytes=1 << 30):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        # key: (width, height, format, bytes or memoryview of a disk file),
+        # least recently used first
+        self._memory = {}
+        self._memory_size = 0
+        # key: file size, least recently used first
+        self._disk = {}
+        self._disk_size = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            entries = []
+            for fname in os.listdir(directory):
+                if fname.endswith(SUFFIX):
+                    st = os.stat(os.path.join(directory, fname))
+                    entries.append((st.st_mtime, fname[:-len(SUFFIX)], st.st_size))
+            for _, key, size in sorted(entries):
+                self._disk[key] = size
+                self._disk_size += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def _remember(self, key, entry):
+        """
+        Put packed entry into the memory tier, evicting old ones
+        """
+        size = len(entry[3])
+        if size > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_size -= len(self._memory.pop(key)[3])
+        self._memory[key] = entry
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            old = next(iter(self._memory))
+            self._memory_size -= len(self._memory.pop(old)[3])
+            self.stats['evictions'] += 1
+
+    def _read(self, key):
+        """
+        Return packed entry from the disk tier or None
+        """
+        if key not in self._disk:
+            return None
+        mm = None
+        try:
+            with open(self._path(key), 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, width, height, fmt = HEADER.unpack_from(mm)
+            fmt = fmt.decode()
+            if (magic != MAGIC or fmt not in 'Bqdr' or fmt != 'r'
+                    and len(mm) - HEADER.size != width * height * struct.calcsize(fmt)):
+                raise ValueError('Corrupted cache file')
+            os.utime(self._path(key))
+        except (OSError, ValueError, struct.error):
+            if mm is not None:
+                mm.close()
+            self._disk_size -= self._disk.pop(key)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            return None
+        self._disk[key] = self._disk.pop(key)
+        # the view keeps the mapping open as long as the entry or its pixels
+        return width, height, fmt, memoryview(mm)[HEADER.size:]
+
+    def _write(self, key, entry):
+        """
+        Store packed entry into the disk tier, evicting old ones
+        """
+        width, height, fmt, data = entry
+        size = HEADER.size + len(data)
+        if size > self.disk_bytes:
+            return
+        temp = self._path(key) + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, width, height, fmt.encode()))
+            f.write(data)
+        os.replace(temp, self._path(key))
+        self._disk_size -= self._disk.pop(key, 0)
+        self._disk[key] = size
+        self._disk_size += size
+        while self._disk_size > self.disk_bytes:
+            old = next(iter(self._disk))
+            self._disk_size -= self._disk.pop(old)
+            try:
+                os.remove(self._path(old))
+            except FileNotFoundError:
+                pass
+            self.stats['evictions'] += 1
+
+    def get(self, key):
+        """
+        Return cached image for the key or None
+        """
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory[key] = entry
+            self.stats['memory_hits'] += 1
+            return _unpacked(*entry)
+        if self.directory is not None:
+            entry = self._read(key)
+            if entry is not None:
+                self._remember(key, entry)
+                self.stats['disk_hits'] += 1
+                return _unpacked(*entry)
+        self.stats['misses'] += 1
+        return None
+
+    def contains(self, key):
+        """
+        Return True if the key is cached, without touching the counters
+        """
+        return key in self._memory or key in self._disk
+
+    def put(self, key, image):
+        """
+        Store image under the key in both tiers
+        """
+        fmt, data = _packed(image)
+        entry = (image.width, image.height, fmt, data)
+        self._remember(key, entry)
+        if self.directory is not None:
+            self._write(key, entry)
+
+    def apply(self, image, name, *args):
+        """
+        Return result of Image method name called with args on the image,
+        computing and storing it on a miss
+        """
+        key = result_key(image_digest(image), name, args)
+        result = self.get(key)
+        if result is None:
+            result = getattr(image, name)(*args)
+            self.put(key, result)
+        return result
+
+    def seam_carving(self, image, n, checkpoint=10):
+        """
+        Return image.seam_carving(n), resuming from the largest cached
+        intermediate with fewer seams removed.  Intermediates are stored
+        every checkpoint seams
+        """
+        digest = image_digest(image)
+        done, result = 0, image
+        for k in range(n, 0, -1):
+            key = result_key(digest, 'seam_carving', (k,))
+            if self.contains(key):
+                cached = self.get(key)
+                if cached is not None:
+                    done, result = k, cached
+                    break
+        if done == n and n:
+            return result
+        if not done:
+            self.stats['misses'] += 1
+        while done < n:
+            step = min(checkpoint - done % checkpoint, n - done)
+            result = result.seam_carving(step)
+            done += step
+            self.put(result_key(digest, 'seam_carving', (done,)), result)
+        return result
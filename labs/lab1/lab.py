@@ -11,6 +11,11 @@ from PIL import Image as PILImage
 # NO ADDITIONAL IMPORTS ALLOWED!
 
 
+# fast correlation paths may differ from the direct sum by floating-point
+# noise; values closer than this to a rounding tie are recomputed directly
+TIE_TOLERANCE = 1e-6
+
+
 def create_blur_kernel(n, c=1):
     """
     Create kernel for box blur
@@ -19,7 +24,924 @@ def create_blur_kernel(n, c=1):
     return [[val] * n for _ in range(n)]
 
 
+def create_sharpen_kernel(n):
+    """
+    Create kernel for unsharp mask
+    """
+    kernel = create_blur_kernel(n, -1)
+    center = n // 2
+    kernel[center][center] += 2
+    return kernel
+
+
+# Sobel operator kernels
+SOBEL_X = ((-1, 0, 1),
+           (-2, 0, 2),
+           (-1, 0, 1))
+SOBEL_Y = ((-1, -2, -1),
+           (0, 0, 0),
+           (1, 2, 1))
+
+
+# pixels converted to grayscale at once by _gray_from_rgb
+LANE_CHUNK = 1 << 16
+
+
+def _gray_from_rgb(raw, bands):
+    """
+    Convert interleaved 8-bit RGB(A) bytes to grayscale bytearray with the
+    same values as round(.299*r + .587*g + .114*b)
+
+    Sums 299*r + 587*g + 114*b + 500 are computed exactly for many pixels at
+    once in a big integer holding one pixel per 48-bit lane, and divided by
+    1000 with a multiply and shift.  Only exact ties (sum ending with 500)
+    are rounded one by one with the floating-point formula.
+    """
+    count = len(raw) // bands
+    gray = bytearray()
+    for start in range(0, count, LANE_CHUNK):
+        n = min(LANE_CHUNK, count - start)
+        lanes = bytearray(6 * n)
+        total = int.from_bytes(b'\xf4\x01\0\0\0\0' * n, 'little')
+        for offset, weight in enumerate((299, 587, 114)):
+            lanes[0::6] = raw[start*bands + offset:(start+n)*bands:bands]
+            total += weight * int.from_bytes(lanes, 'little')
+        # 4294968 / 2**32 is close enough to 1/1000 for sums below 2**18
+        quotient = ((total * 4294968) >> 32).to_bytes(6 * n, 'little')[0::6]
+        lanes[0::6] = quotient
+        rest = (total - 1000 * int.from_bytes(lanes, 'little')).to_bytes(6 * n, 'little')
+        # zero byte for every lane with zero remainder
+        flags = (int.from_bytes(rest[0::6], 'little')
+                 | int.from_bytes(rest[1::6], 'little')).to_bytes(n, 'little')
+        quotient = bytearray(quotient)
+        i = flags.find(0)
+        while i != -1:
+            p = (start + i) * bands
+            quotient[i] = round(.299*raw[p] + .587*raw[p+1] + .114*raw[p+2])
+            i = flags.find(0, i + 1)
+        gray += quotient
+    return gray
+
+
+def _integral(values):
+    """
+    Return True if all values are integers, without scanning compact
+    buffers
+    """
+    if isinstance(values, (bytes, bytearray)):
+        return True
+    if isinstance(values, memoryview):
+        return values.format != 'd'
+    return all(isinstance(c, int) for c in values)
+
+
+def _is_8bit(values):
+    """
+    Return True if all values are integers in [0, 255]
+    """
+    return (isinstance(values, (bytes, bytearray))
+            or all(isinstance(c, int) and 0 <= c <= 255 for c in values))
+
+
+def _compact(values):
+    """
+    Pack pixel values into a compact buffer: bytearray for 8-bit integers,
+    memoryview of 64-bit integers for other integers and of doubles for
+    floats
+    """
+    if isinstance(values, bytearray):
+        return values
+    if not values:
+        return bytearray()
+    if all(isinstance(c, int) for c in values):
+        low, high = min(values), max(values)
+        if 0 <= low and high <= 255:
+            return bytearray(values)
+        if not -2**63 <= low <= high < 2**63:
+            return list(values)
+        fmt = 'q'
+    else:
+        fmt = 'd'
+    buffer = memoryview(bytearray(8 * len(values))).cast(fmt)
+    for i, c in enumerate(values):
+        buffer[i] = c
+    return buffer
+
+
+def filter_halo(name, *args):
+    """
+    Return number of rows above and below a row the filter (name of the
+    Image method with its arguments) reads to compute it
+    """
+    if name == 'inverted':
+        return 0
+    if name == 'edges':
+        return 1
+    if name in ('blurred', 'sharpened'):
+        return args[0] // 2
+    if name == 'correlate':
+        return len(args[0]) // 2
+    raise ValueError('Unsupported filter: %r' % name)
+
+
+def _map_pixels(pixels, func):
+    """
+    Return func values for every pixel in row-major order
+
+    8-bit images have at most 256 distinct values, so func is evaluated once
+    per value present and the resulting table is applied in a single pass
+    (bytearray.translate when the results are 8-bit as well).  Other images
+    fall back to calling func for every pixel.
+    """
+    if not isinstance(pixels, (bytes, bytearray)):
+        if not _is_8bit(pixels):
+            return [func(c) for c in pixels]
+        pixels = bytearray(pixels)
+    table = [0] * 256
+    for c in set(pixels):
+        table[c] = func(c)
+    if all(isinstance(c, int) and 0 <= c <= 255 for c in table):
+        return bytearray(pixels).translate(bytes(table))
+    return [table[c] for c in pixels]
+
+
+def _padded(pixels, width, height, before, after, func=None):
+    """
+    Return row-major copy of the pixels extended by repeating edge pixels:
+    before rows/columns at the top/left and after ones at the bottom/right.
+    If func is given, it is applied to every pixel on the way.  Images of
+    8-bit integers are packed into a bytearray
+    """
+    if isinstance(pixels, memoryview):
+        pixels = pixels.tolist()
+    if func is not None:
+        pixels = _map_pixels(pixels, func)
+    if not isinstance(pixels, bytearray) and _is_8bit(pixels):
+        pixels = bytearray(pixels)
+    if not height:
+        return bytearray()
+    rows = []
+    for y in range(height):
+        line = pixels[y * width:(y + 1) * width]
+        rows.append(line[:1] * before + line + line[-1:] * after)
+    padded = rows[0][:0]
+    for line in [rows[0]] * before + rows + [rows[-1]] * after:
+        padded += line
+    return padded
+
+
+def _box_weights(kernel):
+    """
+    Return (weight, center_extra) if kernel is uniform except for its
+    center value, otherwise None
+    """
+    kern_size = len(kernel)
+    center = kern_size // 2
+    off_center = [w for dy, row in enumerate(kernel)
+                  for dx, w in enumerate(row) if (dx, dy) != (center, center)]
+    val = off_center[0] if off_center else 0
+    if any(w != val for w in off_center):
+        return None
+    return val, kernel[center][center] - val
+
+
+def _kernel_factors(kernel):
+    """
+    Return integer (column, row) vectors whose outer product is the kernel,
+    or None if kernel is not an integer separable kernel
+    """
+    kern_size = len(kernel)
+    values = [w for row in kernel for w in row]
+    if not any(values) or not all(isinstance(w, int) for w in values):
+        return None
+    # pivot on the largest entry and divide its row by the common factor
+    pivot = max(range(len(values)), key=lambda i: abs(values[i]))
+    p_y, p_x = divmod(pivot, kern_size)
+    g = 0
+    for w in kernel[p_y]:
+        g = math.gcd(g, w)
+    row = [w // g for w in kernel[p_y]]
+    if any(kernel[dy][p_x] % row[p_x] for dy in range(kern_size)):
+        return None
+    col = [kernel[dy][p_x] // row[p_x] for dy in range(kern_size)]
+    if all(col[dy] * row[dx] == kernel[dy][dx]
+           for dy in range(kern_size) for dx in range(kern_size)):
+        return col, row
+    return None
+
+
+def _is_near_tie(c):
+    """
+    Check if value is so close to a half-integer that the rounding may
+    depend on the order of summation
+    """
+    return abs(c - math.floor(c) - 0.5) < TIE_TOLERANCE
+
+
+def _padded_pixel(padded, width, x, y, kernel):
+    """
+    Compute correlation of kernel with pixel (x, y) of the padded buffer of
+    an image of given width, summing taps in the same order as
+    Image._correlate_pixel
+    """
+    kern_size = len(kernel)
+    padded_width = width + kern_size - 1
+    c = 0
+    for dx in range(kern_size):
+        for dy in range(kern_size):
+            c += padded[(y+dy) * padded_width + x+dx] * kernel[dy][dx]
+    return c
+
+
+def _correlate_rows(padded, width, height, kernel):
+    """
+    Yield rows (lists) of correlation of kernel with padded image buffer
+
+    On integer images box kernels are computed with a summed-area table and
+    integer separable kernels (e.g. Sobel) with two exact 1-D passes.  The
+    box path agrees with the direct sum up to floating-point rounding;
+    values next to a rounding tie are recomputed directly, so clipped
+    results are the same.  Other kernels are summed in the direct order.
+    """
+    integral = _integral(padded)
+    box = _box_weights(kernel) if integral else None
+    if box is not None and all(isinstance(w, int) for w in box):
+        return _box_rows(padded, width, height, len(kernel), *box)
+    factors = _kernel_factors(kernel) if integral else None
+    if factors is not None:
+        return _separable_rows(padded, width, height, *factors)
+    if box is None:
+        return _general_rows(padded, width, height, kernel)
+    rows = _box_rows(padded, width, height, len(kernel), *box)
+    return _exact_ties(rows, padded, width, kernel)
+
+
+def _exact_ties(rows, padded, width, kernel):
+    """
+    Yield rows with values next to a rounding tie recomputed directly
+    """
+    for y, row in enumerate(rows):
+        for x, c in enumerate(row):
+            if _is_near_tie(c):
+                row[x] = _padded_pixel(padded, width, x, y, kernel)
+        yield row
+
+
+def _general_rows(padded, width, height, kernel):
+    """
+    Yield rows of correlation of padded buffer with kernel
+
+    Taps are accumulated in the same order as in Image._correlate_pixel,
+    so the result is exactly the same.
+    """
+    kern_size = len(kernel)
+    padded_width = width + kern_size - 1
+    taps = [(dy * padded_width + dx, kernel[dy][dx])
+            for dx in range(kern_size) for dy in range(kern_size)
+            if kernel[dy][dx]]
+    for y in range(height):
+        row_start = y * padded_width
+        acc = [0] * width
+        for offset, w in taps:
+            start = row_start + offset
+            acc = [a + c * w for a, c in zip(acc, padded[start:start + width])]
+        yield acc
+
+
+def _box_rows(padded, width, height, kern_size, val, center_extra):
+    """
+    Yield rows of correlation of padded buffer with uniform kernel of
+    weight val plus center_extra in its center using a summed-area table
+    """
+    padded_width = width + kern_size - 1
+    center = kern_size // 2
+    # only the last kern_size+1 rows of the table are kept
+    table = [[0] * (padded_width + 1)]
+    for i in range(height + kern_size - 1):
+        above = table[-1]
+        running = 0
+        sums = [0]
+        for a, c in zip(above[1:], padded[i * padded_width:(i + 1) * padded_width]):
+            running += c
+            sums.append(a + running)
+        table.append(sums)
+        if i + 1 < kern_size:
+            continue
+        top, bottom = table.pop(0), table[-1]
+        base = (i + 1 - kern_size + center) * padded_width + center
+        line = padded[base:base + width]
+        yield [(b1 - b0 - t1 + t0) * val + c * center_extra
+               for b1, b0, t1, t0, c in zip(bottom[kern_size:], bottom,
+                                            top[kern_size:], top, line)]
+
+
+def _separable_rows(padded, width, height, col, row):
+    """
+    Yield rows of correlation of padded buffer with kernel equal to outer
+    product of col and row as horizontal and vertical 1-D passes
+    """
+    kern_size = len(row)
+    padded_width = width + kern_size - 1
+    horizontal = []
+    for y in range(height + kern_size - 1):
+        line = padded[y * padded_width:(y + 1) * padded_width]
+        acc = [0] * width
+        for dx, w in enumerate(row):
+            if w:
+                acc = [a + c * w for a, c in zip(acc, line[dx:])]
+        horizontal.append(acc)
+    for y in range(height):
+        acc = [0] * width
+        for dy, w in enumerate(col):
+            if w:
+                acc = [a + c * w for a, c in zip(acc, horizontal[y + dy])]
+        yield acc
+
+
+def _fixed_point_kernel(kernel, denominator):
+    """
+    Return kernel of integer numerators of the weights over denominator.
+    Raise ValueError if a weight is not such a fraction
+    """
+    numerators = []
+    for row in kernel:
+        numerators.append([])
+        for w in row:
+            c = round(w * denominator)
+            if abs(w * denominator - c) > TIE_TOLERANCE:
+                raise ValueError('Weight %r is not a multiple of 1/%d' % (w, denominator))
+            numerators[-1].append(c)
+    return numerators
+
+
+def _fixed_point_row(row, denominator, exact):
+    """
+    Return row of numerators divided by denominator and rounded
+
+    Exact halves are replaced by round(exact(x)), x being the index in the
+    row, which computes the value with the original float kernel, so the
+    rounding matches correlation with float weights.
+    """
+    double = 2 * denominator
+    result = [(2*c + denominator) // double for c in row]
+    if denominator % 2 == 0:
+        half = denominator // 2
+        for x, c in enumerate(row):
+            if c % denominator == half:
+                result[x] = round(exact(x))
+    return result
+
+
+def _clip_value(c):
+    """
+    Round value and clip it to [0, 255]
+    """
+    return min(255, max(0, round(c)))
+
+
+def _clipped(values):
+    """
+    Return bytearray of values rounded and clipped to [0, 255]
+    """
+    if _integral(values):
+        return bytearray([c if 0 <= c <= 255 else 0 if c < 0 else 255 for c in values])
+    return bytearray([min(255, max(0, round(c))) for c in values])
+
+
+def _compose_functions(first, second):
+    """
+    Return function applying first and then second, either may be None
+    """
+    if first is None or second is None:
+        return first or second
+    return lambda c: second(first(c))
+
+
+def _compose_kernels(first, second):
+    """
+    Return kernel equal to correlation with first and then with second
+    kernel away from the image borders, or None if centers of the kernels
+    do not line up
+    """
+    size = len(first) + len(second) - 1
+    if size // 2 != len(first) // 2 + len(second) // 2:
+        return None
+    result = [[0] * size for _ in range(size)]
+    for dy2, row2 in enumerate(second):
+        for dx2, w2 in enumerate(row2):
+            if w2:
+                for dy1, row1 in enumerate(first):
+                    for dx1, w1 in enumerate(row1):
+                        result[dy1+dy2][dx1+dx2] += w1 * w2
+    return result
+
+
+def _sequential_rows(rows, image, pre, kernels):
+    """
+    Yield rows of correlation with composed kernels, replacing pixels near
+    the borders (where clamping makes composition invalid) and float values
+    next to a rounding tie by results of correlating with every kernel in
+    turn
+    """
+    width, height = image.width, image.height
+    radius = sum(max(len(k) // 2, len(k) - len(k) // 2 - 1) for k in kernels)
+
+    def sequential(x0, y0, x1, y1):
+        crop = image._crop(x0, y0, x1, y1)
+        if pre is not None:
+            crop = Image(crop.width, crop.height, _map_pixels(crop.pixels, pre))
+        for kernel in kernels:
+            crop = crop.correlate(kernel)
+        return crop
+
+    # crops reach 2*radius into the image, so their own edges do not matter;
+    # composed 1x1 kernels (radius 0) have no border to replace
+    if radius:
+        top = sequential(0, 0, width, min(height, 2*radius))
+        bottom = sequential(0, max(0, height - 2*radius), width, height)
+        left = sequential(0, 0, min(width, 2*radius), height)
+        right = sequential(max(0, width - 2*radius), 0, width, height)
+    for y, row in enumerate(rows):
+        if y < radius:
+            row = list(top.pixels[y*width:(y+1)*width])
+        elif y >= height - radius:
+            start = (y - height + bottom.height) * width
+            row = list(bottom.pixels[start:start + width])
+        else:
+            for x in range(radius, width - radius):
+                if isinstance(row[x], float) and _is_near_tie(row[x]):
+                    x0, y0 = max(0, x - 2*radius), max(0, y - 2*radius)
+                    crop = sequential(x0, y0, min(width, x + 2*radius + 1),
+                                      min(height, y + 2*radius + 1))
+                    row[x] = crop.get_pixel(x - x0, y - y0)
+            if not radius:
+                yield row
+                continue
+            row[:radius] = left.pixels[y*left.width:y*left.width + radius]
+            end = (y + 1) * right.width
+            row[max(0, width - radius):] = right.pixels[max(end - radius, end - width):end]
+        yield row
+
+
+def _plane_rows(pixels, width, height, planes, kernels):
+    """
+    Yield (p, y, rows), rows being the rows y of correlation of every
+    kernel with plane p of the pixels (planes images of width x height
+    stored one after another)
+
+    The padded planes are stacked and correlated in one pass, skipping rows
+    which mix two planes.
+    """
+    kern_size = len(kernels[0])
+    before = kern_size // 2
+    after = kern_size - before - 1
+    size = width * height
+    padded = None
+    for p in range(planes):
+        plane = _padded(pixels[p*size:(p+1)*size], width, height, before, after)
+        if padded is None:
+            padded = plane
+        elif type(padded) is type(plane):
+            padded += plane
+        else:
+            padded = list(padded) + list(plane)
+    stride = height + kern_size - 1
+    for i, rows in enumerate(zip(*(_correlate_rows(padded, width,
+                                                   planes*stride - kern_size + 1, kernel)
+                                   for kernel in kernels))):
+        if i % stride < height:
+            yield i // stride, i % stride, rows
+
+
+def _plane_pixel(padded, pixels, width, height, p, x, y, kernel):
+    """
+    Return correlation of kernel with pixel (x, y) of plane p of the pixels
+    summed in the reference order.  padded is a dict of padded planes
+    filled on demand
+    """
+    if p not in padded:
+        size = width * height
+        kern_size = len(kernel)
+        padded[p] = _padded(pixels[p*size:(p+1)*size], width, height,
+                            kern_size // 2, kern_size - kern_size//2 - 1)
+    return _padded_pixel(padded[p], width, x, y, kernel)
+
+
+def _correlate_planes(pixels, width, height, planes, kernel, fixed_point=None):
+    """
+    Return compact buffer of correlation of kernel with every plane of the
+    pixels (see Image.correlate for fixed_point)
+    """
+    weights = kernel
+    if fixed_point is not None:
+        weights = _fixed_point_kernel(kernel, fixed_point)
+        if not _integral(pixels):
+            return _compact([round(c) for c in
+                             _correlate_planes(pixels, width, height, planes, kernel)])
+    results = [[] for _ in range(planes)]
+    padded = {}
+    for p, y, (row,) in _plane_rows(pixels, width, height, planes, [weights]):
+        if fixed_point is not None:
+            row = _fixed_point_row(row, fixed_point, lambda x: _plane_pixel(
+                padded, pixels, width, height, p, x, y, kernel))
+        results[p].extend(row)
+    return _compact([c for result in results for c in result])
+
+
+def _edges_planes(pixels, width, height, planes):
+    """
+    Return bytearray of clipped Sobel magnitudes of every plane of the
+    pixels
+    """
+    results = [bytearray() for _ in range(planes)]
+    for p, _, (ox, oy) in _plane_rows(pixels, width, height, planes, [SOBEL_X, SOBEL_Y]):
+        # magnitudes are never negative
+        results[p].extend([min(255, round(math.sqrt(a**2 + b**2))) for a, b in zip(ox, oy)])
+    return bytearray().join(results)
+
+
+# bits of a lane of the big-integer rows of multi-channel images
+ROW_LANE = 64
+
+
+def _lanes(value, count):
+    """
+    Return big integer holding value in each of count lanes
+    """
+    return int.from_bytes(value.to_bytes(ROW_LANE // 8, 'little') * count, 'little')
+
+
+def _lane_rows(pixels, width, height, planes, before, after):
+    """
+    Return list of big integers, one for each row of the 8-bit planes
+    padded by repeating edge pixels (see _padded).  Value of plane p in
+    padded column x is held in lane x*planes + p
+    """
+    size = width * height
+    step = planes * ROW_LANE // 8
+    rows = []
+    for y in range(height):
+        lanes = bytearray((width + before + after) * step)
+        for p in range(planes):
+            line = pixels[p*size + y*width:p*size + (y+1)*width]
+            lanes[p * ROW_LANE // 8::step] = line[:1] * before + line + line[-1:] * after
+        rows.append(int.from_bytes(lanes, 'little'))
+    if not rows:
+        return []
+    return [rows[0]] * before + rows + [rows[-1]] * after
+
+
+def _lane_correlate(rows, height, planes, kernel):
+    """
+    Yield big integers of rows of correlation of the integer kernel with
+    lane rows (see _lane_rows).  Lanes of the results hold signed values:
+    the big integers are exact sums, lanes are separated by _lane_bytes
+    """
+    shift = planes * ROW_LANE
+    factors = _kernel_factors(kernel)
+    if factors is not None:
+        col, row = factors
+        sums = [sum(w * (r >> dx*shift) for dx, w in enumerate(row) if w) for r in rows]
+        for y in range(height):
+            yield sum(w * sums[y+dy] for dy, w in enumerate(col) if w)
+        return
+    shifted = [[r >> dx*shift for r in rows] for dx in range(len(kernel))]
+    for y in range(height):
+        yield sum(w * shifted[dx][y+dy]
+                  for dy, line in enumerate(kernel) for dx, w in enumerate(line) if w)
+
+
+def _lane_bytes(value, count):
+    """
+    Return bytes of count lanes of big integer value (ROW_LANE // 8 bytes
+    each)
+    """
+    return value.to_bytes(count * ROW_LANE // 8, 'little')
+
+
+def _dividend_bits(denominator, bound):
+    """
+    Return bits of dividends of _lane_fixed_point; lanes fit products of
+    dividends and the multiplier if it is at most (ROW_LANE - 1) // 2
+    """
+    offset = bound // denominator + 1
+    return (2*bound + (2*offset + 1) * denominator).bit_length()
+
+
+def _lane_fixed_point(value, count, denominator, bound):
+    """
+    Return (bytes, ties): lanes of value (signed numerators not exceeding
+    bound in absolute value) divided by denominator, rounded and clipped to
+    [0, 255], one byte per lane, and list of lane indexes of exact halves
+
+    Everything is computed for all lanes at once with big-integer
+    arithmetic; division uses a multiply and shift (see _dividend_bits).
+    """
+    half = 1 << (ROW_LANE - 1)
+    offset = bound // denominator + 1
+    double = 2 * denominator
+    # dividend lanes 2*c + (2*offset + 1)*denominator are positive
+    dividend = 2 * value + _lanes((2*offset + 1) * denominator, count)
+    bits = _dividend_bits(denominator, bound)
+    shift = bits + double.bit_length()
+    magic = -(-(1 << shift) // double)
+    low = _lanes((1 << (ROW_LANE - shift)) - 1, count)
+    # lanes of quotient hold rounded value + offset
+    quotient = ((dividend * magic) >> shift) & low
+    ties = []
+    if denominator % 2 == 0:
+        rest = dividend - quotient * double
+        # high bit of a lane is set if its remainder is not zero
+        flags = _lane_bytes((rest + _lanes(half - 1, count)) & _lanes(half, count),
+                            count)[ROW_LANE // 8 - 1::ROW_LANE // 8]
+        i = flags.find(0)
+        while i != -1:
+            ties.append(i)
+            i = flags.find(0, i + 1)
+    ones = _lanes((1 << ROW_LANE) - 1, count)
+
+    def at_least(c):
+        # lanes of all ones where quotient lane >= c, zero elsewhere
+        return (((quotient + _lanes(half - c, count)) & _lanes(half, count))
+                >> (ROW_LANE - 1)) * ((1 << ROW_LANE) - 1)
+    positive = at_least(offset)
+    above = at_least(offset + 256)
+    clipped = (((quotient & positive) - (_lanes(offset, count) & positive)) & (ones ^ above)
+               | (_lanes(255, count) & above))
+    return _lane_bytes(clipped, count)[0::ROW_LANE // 8], ties
+
+
+def _lane_values(value, count):
+    """
+    Return list of signed values of count lanes of big integer value
+    """
+    half = _lanes(1 << (ROW_LANE - 1), count)
+    # biased lanes do not borrow; flipping the bias bit back gives two's
+    # complement lanes
+    return memoryview(_lane_bytes((value + half) ^ half, count)).cast('q').tolist()
+
+
+def _sobel_energy(rows, x, y, width, height):
+    """
+    Return clipped Sobel magnitude of pixel (x, y) of an image stored as a
+    list of rows, the same value as Image.edges gives for integer images
+    """
+    above, line, below = rows[max(y-1, 0)], rows[y], rows[min(y+1, height-1)]
+    left, right = max(x-1, 0), min(x+1, width-1)
+    ox = (above[right] - above[left] + 2 * (line[right] - line[left])
+          + below[right] - below[left])
+    oy = (below[left] + 2 * below[x] + below[right]
+          - above[left] - 2 * above[x] - above[right])
+    return min(255, max(0, round(math.sqrt(ox**2 + oy**2))))
+
+
+def _dp_back(above):
+    """
+    Return backpointers of a row of the cumulative energy map given its
+    previous row: 0, 1 or 2 for the pixel above at x-1, x or x+1 with the
+    minimum cost (the leftmost one of equal costs, as Image._get_min_index)
+    """
+    inf = float('inf')
+    return bytearray([0 if a <= b and a <= c else 1 if b <= c else 2
+                      for a, b, c in zip([inf] + above[:-1], above, above[1:] + [inf])])
+
+
+def _dp_cost(above, energy):
+    """
+    Return row of the cumulative energy map given its previous row
+    """
+    inf = float('inf')
+    return [e + (a if a <= b and a <= c else b if b <= c else c)
+            for e, a, b, c in zip(energy, [inf] + above[:-1], above, above[1:] + [inf])]
+
+
+def _seam_dp(energy):
+    """
+    Return (cost, back): rows of the cumulative energy map of the energy
+    given as a list of rows and rows of backpointers (see _dp_back)
+    """
+    cost = [list(energy[0])]
+    back = [bytearray(len(energy[0]))]
+    for line in energy[1:]:
+        back.append(_dp_back(cost[-1]))
+        cost.append(_dp_cost(cost[-1], line))
+    return cost, back
+
+
+def _trace_seam(back, x):
+    """
+    Return x coordinates of the path ending at bottom pixel x following the
+    backpointers
+    """
+    path = [x]
+    for line in reversed(back[1:]):
+        x += line[x] - 1
+        path.append(x)
+    path.reverse()
+    return path
+
+
+def _trace_seams(cost, back, k):
+    """
+    Return up to k paths of minimum cost which share no pixel, the first of
+    them being the minimum-cost seam
+    """
+    bottom = cost[-1]
+    height = len(cost)
+    taken = [bytearray(len(bottom)) for _ in cost]
+    paths = []
+    for x in sorted(range(len(bottom)), key=bottom.__getitem__):
+        path = [x]
+        for y in range(height - 1, 0, -1):
+            if taken[y][x]:
+                break
+            x += back[y][x] - 1
+            path.append(x)
+        if len(path) < height or taken[0][x]:
+            continue
+        path.reverse()
+        for line, x in zip(taken, path):
+            line[x] = 1
+        paths.append(path)
+        if len(paths) == k:
+            break
+    return paths
+
+
+def _min_seam(cost):
+    """
+    Return x coordinates of the minimum-cost path through the cumulative
+    energy map given as a list of rows, as Image._get_min_path does
+    """
+    bottom = cost[-1]
+    x = bottom.index(min(bottom))
+    path = [x]
+    for line in reversed(cost[:-1]):
+        start = max(x-1, 0)
+        window = line[start:x+2]
+        x = start + window.index(min(window))
+        path.append(x)
+    path.reverse()
+    return path
+
+
+def _carve_seams(channels, energy, width, height, n, removed=None):
+    """
+    Remove n minimum-energy seams from the channels (each a list of rows)
+    in place.  energy is the list of rows of the summed Sobel energies of
+    the channels.  Return the new width.  removed, if given, is extended by
+    the paths (see _carve)
+
+    A removed seam changes the energy only of pixels whose 3x3
+    neighbourhood touches it, i.e. within one column of the path in the
+    row or the rows next to it.  The cumulative map is recomputed in that
+    band and in the cone below pixels whose cost actually changed.
+    """
+    cost = [energy[0][:]]
+    for line in energy[1:]:
+        cost.append(_dp_cost(cost[-1], line))
+    for _ in range(n):
+        path = _min_seam(cost)
+        if removed is not None:
+            removed.append([path])
+        for y, x in enumerate(path):
+            for rows in channels:
+                del rows[y][x]
+            del energy[y][x]
+            del cost[y][x]
+        width -= 1
+        changed = set()
+        for y in range(height):
+            band = set()
+            for near in (max(y-1, 0), y, min(y+1, height-1)):
+                band.update(range(max(path[near]-1, 0), min(path[near]+2, width)))
+            for x in band:
+                energy[y][x] = sum(_sobel_energy(rows, x, y, width, height)
+                                   for rows in channels)
+            for x in changed:
+                band.update(range(max(x-1, 0), min(x+2, width)))
+            changed = set()
+            for x in band:
+                c = energy[y][x]
+                if y:
+                    c += min(cost[y-1][max(x-1, 0):x+2])
+                if c != cost[y][x]:
+                    cost[y][x] = c
+                    changed.add(x)
+    return width
+
+
+def _seam_channels(pixels, width, height, planes):
+    """
+    Return list of rows (lists) of every plane of the pixels
+    """
+    size = width * height
+    return [[list(pixels[p*size + y*width:p*size + (y+1)*width]) for y in range(height)]
+            for p in range(planes)]
+
+
+def _channels_pixels(channels):
+    """
+    Return compact buffer of planes given as lists of rows
+    """
+    return _compact([c for rows in channels for line in rows for c in line])
+
+
+def _transposed(pixels, width, height, planes):
+    """
+    Return pixels of every plane transposed (columns become rows)
+    """
+    if isinstance(pixels, memoryview):
+        pixels = pixels.tolist()
+    size = width * height
+    columns = [pixels[p*size:(p+1)*size][x::width] for p in range(planes) for x in range(width)]
+    if isinstance(pixels, bytearray):
+        return bytearray().join(columns)
+    return [c for column in columns for c in column]
+
+
+def _image_energy(image):
+    """
+    Return rows of energy of the image: sum of edges() values of its
+    channels
+    """
+    width, height, planes = image.width, image.height, image.CHANNELS
+    edges = image.edges().pixels
+    size = width * height
+    return [[sum(values) for values in zip(*(edges[p*size + y*width:p*size + (y+1)*width]
+                                            for p in range(planes)))]
+            for y in range(height)]
+
+
+def _carve(image, n, batch=1, incremental=True, removed=None):
+    """
+    Return (channels, width): rows of every channel of the image with n
+    vertical seams of minimum energy removed
+
+    With batch=1 one seam is removed per pass; incremental=True keeps the
+    energy and cumulative maps between passes (see _carve_seams).  Larger
+    batches remove up to batch seams sharing no pixel per computation of
+    the maps.  removed, if given, is extended by lists of paths removed at
+    once, in coordinates of the image at that time.
+    """
+    width, height, planes = image.width, image.height, image.CHANNELS
+    if n >= width:
+        raise ValueError('Cannot remove %d seams from image of width %d' % (n, width))
+    channels = _seam_channels(image.pixels, width, height, planes)
+    if batch == 1 and incremental and _integral(image.pixels):
+        energy = _image_energy(image)
+        return channels, _carve_seams(channels, energy, width, height, n, removed)
+    while n:
+        current = type(image)(width, height, _channels_pixels(channels))
+        cost, back = _seam_dp(_image_energy(current))
+        paths = _trace_seams(cost, back, min(batch, n))
+        for y in range(height):
+            drop = {path[y] for path in paths}
+            for rows in channels:
+                rows[y] = [c for x, c in enumerate(rows[y]) if x not in drop]
+        if removed is not None:
+            removed.append(paths)
+        width -= len(paths)
+        n -= len(paths)
+    return channels, width
+
+
+def _insert_seams(image, n):
+    """
+    Return channels (lists of rows) of the image with n vertical seams
+    added: the n seams which would be removed first are duplicated, the new
+    pixel after every seam pixel being the average of it and its right
+    neighbour
+    """
+    width, height, planes = image.width, image.height, image.CHANNELS
+    removed = []
+    _carve(image, n, removed=removed)
+    channels = _seam_channels(image.pixels, width, height, planes)
+    for y in range(height):
+        # map removed paths back to the original columns
+        columns = list(range(width))
+        seams = []
+        for paths in removed:
+            for x in sorted((path[y] for path in paths), reverse=True):
+                seams.append(columns.pop(x))
+        for rows in channels:
+            line = rows[y]
+            for x in sorted(seams, reverse=True):
+                line.insert(x + 1, round((line[x] + line[min(x + 1, width - 1)]) / 2))
+    return channels
+
+
 class Image:
+    """
+    Grayscale image with row-major pixels
+
+    Pixels may be any sequence of numbers.  Images produced by load, _clip
+    and correlate keep them in a compact buffer (see _compact) instead of
+    a list of Python numbers.
+    """
+    __slots__ = ('width', 'height', 'pixels')
+    CHANNELS = 1
+
     def __init__(self, width, height, pixels):
         self.width = width
         self.height = height
@@ -55,20 +977,37 @@ class Image:
     def set_pixel(self, x, y, c):
         """
         Change a value of the pixel
+
+        Compact pixels (bytearray or memoryview) which cannot hold the value
+        are widened to a list.
         """
-        self.pixels[self._get_index(x, y)] = c
+        i = self._get_index(x, y)
+        try:
+            self.pixels[i] = c
+        except (TypeError, ValueError, OverflowError):
+            self.pixels = list(self.pixels)
+            self.pixels[i] = c
+
+    def _crop(self, x0, y0, x1, y1):
+        """
+        Return part of the image with columns [x0, x1) and rows [y0, y1)
+        """
+        pixels = []
+        for y in range(y0, y1):
+            pixels.extend(self.pixels[y*self.width + x0:y*self.width + x1])
+        return Image(x1 - x0, y1 - y0, pixels)
+
+    def pipeline(self):
+        """
+        Return lazy Pipeline of filters starting from this image
+        """
+        return Pipeline(self)
 
     def apply_per_pixel(self, func):
         """
-        Apply function to the every pixel
+        Apply function to the every pixel (see _map_pixels)
         """
-        result = Image.new(self.width, self.height)
-        for x in range(result.width):
-            for y in range(result.height):
-                color = self.get_pixel(x, y)
-                newcolor = func(color)
-                result.set_pixel(x, y, newcolor)
-        return result
+        return Image(self.width, self.height, _compact(_map_pixels(self.pixels, func)))
 
     def inverted(self):
         """
@@ -76,66 +1015,73 @@ class Image:
         """
         return self.apply_per_pixel(lambda c: 255-c)
 
-    def correlate(self, kernel):
+    def correlate(self, kernel, fixed_point=None):
         """
         Apply kernel to image and yield a new image
+
+        The image is extended once into a padded buffer and the kernel is
+        applied row by row with precomputed offsets (see _correlate_rows).
+
+        fixed_point is a common denominator of the kernel weights.  If it is
+        given, integer images are correlated with the integer numerators and
+        each result is divided and rounded exactly once, so the result is an
+        integer image equal to the rounded float one.  Only exact halves are
+        recomputed with the float weights, whose rounding errors decide them.
+        """
+        return Image(self.width, self.height,
+                     _correlate_planes(self.pixels, self.width, self.height, 1,
+                                       kernel, fixed_point))
+
+    def _correlate_pixel(self, x, y, kernel):
+        """
+        Compute correlation of kernel with the neighbourhood of pixel (x, y)
         """
-        result = Image.new(self.width, self.height)
         kern_size = len(kernel)
         center = kern_size // 2
-        for base_x in range(self.width):
-            x = base_x - center
-            for base_y in range(self.height):
-                y = base_y - center
-                c = 0
-                for dx in range(kern_size):
-                    for dy in range(kern_size):
-                        c += self.get_unbounded_pixel(x+dx, y+dy) * kernel[dy][dx]
-                result.set_pixel(base_x, base_y, c)
+        x -= center
+        y -= center
+        c = 0
+        for dx in range(kern_size):
+            for dy in range(kern_size):
+                c += self.get_unbounded_pixel(x+dx, y+dy) * kernel[dy][dx]
+        return c
+
+    def _correlate_direct(self, kernel):
+        """
+        Apply kernel to image pixel by pixel
+        """
+        result = Image.new(self.width, self.height)
+        for x in range(self.width):
+            for y in range(self.height):
+                result.set_pixel(x, y, self._correlate_pixel(x, y, kernel))
         return result
 
     def _clip(self):
         """
         Correct pixels value in the image. Result is a new image
         """
-        min_val = 0
-        max_val = 255
-        return Image(self.width,
-                     self.height,
-                     [min(max_val, max(min_val, round(c))) for c in self.pixels])
+        return Image(self.width, self.height, _clipped(self.pixels))
 
     def blurred(self, n):
         """
         Apply box blur to the image. Result is a new image
         """
         kernel = create_blur_kernel(n)
-        return self.correlate(kernel)._clip()
+        return self.correlate(kernel, fixed_point=n*n)._clip()
 
     def sharpened(self, n):
         """
         Apply unsharp mask filter to the image. Result is a new image
         """
-        kernel = create_blur_kernel(n, -1)
-        center = n // 2
-        kernel[center][center] += 2
-        return self.correlate(kernel)._clip()
+        kernel = create_sharpen_kernel(n)
+        return self.correlate(kernel, fixed_point=n*n)._clip()
 
     def edges(self):
         """
         Apply Sobel operator to the image. Result is a new image
         """
-        kx = ((-1, 0, 1),
-              (-2, 0, 2),
-              (-1, 0, 1))
-        ky = ((-1, -2, -1),
-              (0, 0, 0),
-              (1, 2, 1))
-        ox = self.correlate(kx)
-        oy = self.correlate(ky)
-        return Image(self.width,
-                     self.height,
-                     [math.sqrt(a**2 + b**2)
-                      for a, b in zip(ox.pixels, oy.pixels)])._clip()
+        return Image(self.width, self.height,
+                     _edges_planes(self.pixels, self.width, self.height, 1))
 
     def _find_min_column(self):
         """
@@ -149,80 +1095,150 @@ class Image:
         """
         Delete column n from the image
         """
-        self.pixels = [c for i, c in enumerate(self.pixels)
-                       if i % self.width != n]
-        self.width -= 1
+        self._remove_columns({n})
+
+    def _remove_columns(self, columns):
+        """
+        Delete all the columns (collection of indexes) in one pass
+        """
+        width = self.width
+        kept = [x for x in range(width) if x not in columns]
+        # runs of consecutive kept columns are copied as whole slices
+        runs = []
+        for x in kept:
+            if runs and runs[-1][1] == x:
+                runs[-1][1] = x + 1
+            else:
+                runs.append([x, x + 1])
+        pixels = self.pixels
+        if isinstance(pixels, memoryview):
+            pixels = pixels.tolist()
+        parts = [pixels[y*width + start:y*width + stop]
+                 for y in range(self.height) for start, stop in runs]
+        if isinstance(pixels, bytearray):
+            self.pixels = bytearray().join(parts)
+        else:
+            self.pixels = [c for part in parts for c in part]
+        self.width = len(kept)
+
+    def _column_energy(self, columns, i):
+        """
+        Return sum of edges() values of column i of the image formed by the
+        columns (list of column indexes) of self
+
+        Only the column and its neighbours affect the value, so edges() is
+        computed on a crop of at most three columns.
+        """
+        width = self.width
+        crop = columns[max(i - 1, 0):i + 2]
+        pixels = [self.pixels[y*width + x] for y in range(self.height) for x in crop]
+        edges = Image(len(crop), self.height, pixels).edges()
+        return sum(edges.pixels[min(i, 1)::len(crop)])
 
     def retarget(self, n):
         """
         Scale down an image by n columns and preserving important parts
 
         n smaller then self.width
+
+        Column energies (sums of the edges() values) are computed once.
+        Removing a column changes only the energies of its two new
+        neighbours, so only these are recomputed; the columns are removed
+        from the pixels at the end in one pass.
         """
-        img = Image(self.width, self.height, self.pixels)
+        edges = self.edges()
+        energies = [sum(edges.pixels[x::self.width]) for x in range(self.width)]
+        kept = list(range(self.width))
         for _ in range(n):
-            # compute energy map
-            energy_map = img.edges()
-            # find the minimum energy column
-            i = energy_map._find_min_column()
-            # remove the column
-            img._remove_column(i)
+            i = energies.index(min(energies))
+            del kept[i]
+            del energies[i]
+            for x in range(max(i - 1, 0), min(i + 1, len(kept))):
+                energies[x] = self._column_energy(kept, x)
+        img = Image(self.width, self.height, self.pixels)
+        img._remove_columns(set(range(self.width)) - set(kept))
         return img
 
     def _get_cumulative_map(self):
         """
-        Create the cumulative energy map. Modify energy map
+        Create the cumulative energy map. Modify energy map.  Return rows of
+        backpointers for _get_min_path (see _seam_dp)
         """
-        for y in range(1, self.height):
-            for x in range(self.width):
-                prev_energy = min(self.get_unbounded_pixel(i, y-1) for i in range(x-1, x+2))
-                self.set_pixel(x, y, prev_energy+self.get_pixel(x, y))
+        width = self.width
+        cost, back = _seam_dp([list(self.pixels[y*width:(y+1)*width])
+                               for y in range(self.height)])
+        # cumulative energies do not fit into 8-bit storage
+        self.pixels = [c for line in cost for c in line]
+        return back
 
-    def _get_min_path(self):
+    def _get_min_path(self, back=None):
         """
         Return x coordinate min path pixels
+
+        back are the backpointers returned by _get_cumulative_map; they are
+        computed from the map if not given.
         """
-        path = []
-        x = self._get_min_index(self.height-1, 0, self.width-1)
-        path.append(x)
-        for y in range(self.height-2, -1, -1):
-            x = self._get_min_index(y, x-1, x+1)
-            path.append(x)
-        path.reverse()
-        return path
+        width = self.width
+        rows = [list(self.pixels[y*width:(y+1)*width]) for y in range(self.height)]
+        if back is None:
+            back = [bytearray(width)] + [_dp_back(line) for line in rows[:-1]]
+        bottom = rows[-1]
+        return _trace_seam(back, bottom.index(min(bottom)))
 
     def _get_min_index(self, y, x_start, x_end):
         index = min((self.get_unbounded_pixel(x, y), x) for x in range(x_start, x_end+1))[1]
         return max(0, min(self.width-1, index))
 
-    def seam_carving(self, n):
+    def _transposed(self):
+        """
+        Return transposed image (columns become rows)
+        """
+        return Image(self.height, self.width,
+                     _transposed(self.pixels, self.width, self.height, 1))
+
+    def seam_carving(self, n, incremental=True, horizontal=False, batch=1):
         """
         Seam carving algorithm for shrink image
+
+        With incremental=True (used for integer images) the energy and the
+        cumulative maps are kept between seams and only updated around the
+        removed path, which gives the same result much faster.
+        horizontal=True removes horizontal seams (rows) instead; the image
+        is transposed once before and after.  batch > 1 removes up to batch
+        seams sharing no pixel for every computation of the maps.
         """
-        img = Image(self.width, self.height, self.pixels)
-        for _ in range(n):
-            # compute energy map
-            energy_map = img.edges()
-            # find the minimum-cost path from top to bottom
-            energy_map._get_cumulative_map()
-            path = energy_map._get_min_path()
-            # remove the computed path
-            img.pixels = [img.get_pixel(x, y)
-                          for y in range(img.height)
-                          for x in range(img.width)
-                          if path[y] != x]
-            img.width -= 1
-        return img
+        img = self._transposed() if horizontal else self
+        channels, width = _carve(img, n, batch, incremental)
+        result = Image(width, img.height, _channels_pixels(channels))
+        return result._transposed() if horizontal else result
+
+    def seam_insertion(self, n, horizontal=False):
+        """
+        Enlarge image by n columns (rows if horizontal) duplicating the n
+        seams of lowest energy (see _insert_seams)
+        """
+        img = self._transposed() if horizontal else self
+        result = Image(img.width + n, img.height, _channels_pixels(_insert_seams(img, n)))
+        return result._transposed() if horizontal else result
 
     # Below this point are utilities for loading, saving, and displaying
     # images, as well as for testing.
 
     def __eq__(self, other):
-        return all(getattr(self, i) == getattr(other, i)
-                   for i in ('height', 'width', 'pixels'))
+        # compare pixel values regardless of the storage
+        return (isinstance(other, Image)
+                and all(getattr(self, i) == getattr(other, i)
+                        for i in ('height', 'width'))
+                and list(self.pixels) == list(other.pixels))
 
     def __repr__(self):
-        return "Image(%s, %s, %s)" % (self.width, self.height, self.pixels)
+        return "Image(%s, %s, %s)" % (self.width, self.height, list(self.pixels))
+
+    def compacted(self):
+        """
+        Return the same image with pixels in a compact buffer
+        """
+        return Image(self.width, self.height, _compact(list(self.pixels)))
 
     @classmethod
     def load(cls, fname):
@@ -236,13 +1252,13 @@ class Image:
         """
         with open(fname, 'rb') as img_handle:
             img = PILImage.open(img_handle)
-            img_data = img.getdata()
+            raw = img.tobytes()
             if img.mode.startswith('RGB'):
-                pixels = [round(.299*p[0] + .587*p[1] + .114*p[2]) for p in img_data]
+                pixels = _gray_from_rgb(raw, len(img.getbands()))
             elif img.mode == 'LA':
-                pixels = [p[0] for p in img_data]
+                pixels = bytearray(raw[0::2])
             elif img.mode == 'L':
-                pixels = list(img_data)
+                pixels = bytearray(raw)
             else:
                 raise ValueError('Unsupported image mode: %r' % img.mode)
             w, h = img.size
@@ -265,14 +1281,25 @@ class Image:
         If fname is given as a file-like object, the file type will be
         determined by the 'mode' parameter.
         """
-        out = PILImage.new(mode='L', size=(self.width, self.height))
-        out.putdata(self.pixels)
+        out = self._pil_image()
         if isinstance(fname, str):
             out.save(fname)
         else:
             out.save(fname, mode)
         out.close()
 
+    def _pil_image(self):
+        """
+        Return PIL image with the same pixels.  Images stored in a bytearray
+        share their buffer with it
+        """
+        size = (self.width, self.height)
+        if isinstance(self.pixels, bytearray):
+            return PILImage.frombuffer('L', size, self.pixels, 'raw', 'L', 0, 1)
+        out = PILImage.new(mode='L', size=size)
+        out.putdata(list(self.pixels))
+        return out
+
     def gif_data(self):
         """
         Returns a base 64 encoded string containing the given image as a GIF
@@ -311,9 +1338,7 @@ class Image:
             #  * grab the base64-encoded GIF data from the resized image
             #  * put that in a tkinter label
             #  * show that image on the canvas
-            new_img = PILImage.new(mode='L', size=(self.width, self.height))
-            new_img.putdata(self.pixels)
-            new_img = new_img.resize((event.width, event.height), PILImage.NEAREST)
+            new_img = self._pil_image().resize((event.width, event.height), PILImage.NEAREST)
             buff = BytesIO()
             new_img.save(buff, 'GIF')
             canvas.img = tkinter.PhotoImage(data=base64.b64encode(buff.getvalue()))
@@ -328,6 +1353,351 @@ class Image:
         toplevel.protocol('WM_DELETE_WINDOW', tk_root.destroy)
 
 
+class ColorImage:
+    """
+    RGB image stored as three planes (red, green and blue images of
+    width x height) one after another in a single compact buffer
+
+    Filters run on all three planes in one pass over a stacked padded
+    buffer, with the same kernels and results as Image for each channel.
+    """
+    __slots__ = ('width', 'height', 'pixels')
+    CHANNELS = 3
+
+    def __init__(self, width, height, pixels):
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+
+    @classmethod
+    def from_channels(cls, red, green, blue):
+        """
+        Create color image from three Image channels of the same size
+        """
+        pixels = []
+        for channel in (red, green, blue):
+            pixels.extend(channel.pixels)
+        return cls(red.width, red.height, _compact(pixels))
+
+    def channel(self, i):
+        """
+        Return channel i (0 red, 1 green, 2 blue) as an Image
+        """
+        size = self.width * self.height
+        return Image(self.width, self.height, self.pixels[i*size:(i+1)*size])
+
+    def get_pixel(self, x, y):
+        """
+        Return (red, green, blue) values of the pixel
+        """
+        size = self.width * self.height
+        i = x + y*self.width
+        return tuple(self.pixels[p*size + i] for p in range(self.CHANNELS))
+
+    def set_pixel(self, x, y, color):
+        """
+        Change (red, green, blue) values of the pixel
+
+        Compact pixels (bytearray or memoryview) which cannot hold the values
+        are widened to a list.
+        """
+        size = self.width * self.height
+        i = x + y*self.width
+        for p, c in enumerate(color):
+            try:
+                self.pixels[p*size + i] = c
+            except (TypeError, ValueError, OverflowError):
+                self.pixels = list(self.pixels)
+                self.pixels[p*size + i] = c
+
+    def apply_per_pixel(self, func):
+        """
+        Apply function to the every value of every channel
+        """
+        return ColorImage(self.width, self.height, _compact(_map_pixels(self.pixels, func)))
+
+    def inverted(self):
+        """
+        Invert value of pixels
+        """
+        return self.apply_per_pixel(lambda c: 255-c)
+
+    def correlate(self, kernel, fixed_point=None):
+        """
+        Apply kernel to every channel and yield a new image
+        (see Image.correlate)
+        """
+        return ColorImage(self.width, self.height,
+                          _correlate_planes(self.pixels, self.width, self.height,
+                                            self.CHANNELS, kernel, fixed_point))
+
+    def _clip(self):
+        """
+        Correct pixels value in the image. Result is a new image
+        """
+        return ColorImage(self.width, self.height, _clipped(self.pixels))
+
+    def _rounded(self, kernel, denominator):
+        """
+        Return self.correlate(kernel, fixed_point=denominator)._clip()
+
+        8-bit images are correlated a row of all channels at a time on big
+        integers (see _lane_rows), where division, rounding and clipping are
+        done for all lanes at once as well.
+        """
+        numerators = _fixed_point_kernel(kernel, denominator)
+        bound = 255 * sum(abs(w) for line in numerators for w in line)
+        width, height, planes = self.width, self.height, self.CHANNELS
+        kern_size = len(kernel)
+        if (not isinstance(self.pixels, bytearray)
+                or _dividend_bits(denominator, bound) > (ROW_LANE - 1) // 2):
+            return self.correlate(kernel, fixed_point=denominator)._clip()
+        count = (width + kern_size - 1) * planes
+        rows = _lane_rows(self.pixels, width, height, planes,
+                          kern_size // 2, kern_size - kern_size//2 - 1)
+        results = [bytearray() for _ in range(planes)]
+        # padded channels for recomputing exact halves with float weights
+        padded = {}
+        for y, value in enumerate(_lane_correlate(rows, height, planes, numerators)):
+            line, ties = _lane_fixed_point(value, count, denominator, bound)
+            line = bytearray(line[:width * planes])
+            for i in ties:
+                if i < width * planes:
+                    line[i] = _clip_value(_plane_pixel(padded, self.pixels, width, height,
+                                                       i % planes, i // planes, y, kernel))
+            for p in range(planes):
+                results[p] += line[p::planes]
+        return ColorImage(width, height, bytearray().join(results))
+
+    def blurred(self, n):
+        """
+        Apply box blur to the image. Result is a new image
+        """
+        return self._rounded(create_blur_kernel(n), n*n)
+
+    def sharpened(self, n):
+        """
+        Apply unsharp mask filter to the image. Result is a new image
+        """
+        return self._rounded(create_sharpen_kernel(n), n*n)
+
+    def edges(self):
+        """
+        Apply Sobel operator to every channel. Result is a new image
+        """
+        width, height, planes = self.width, self.height, self.CHANNELS
+        if not isinstance(self.pixels, bytearray):
+            return ColorImage(width, height, _edges_planes(self.pixels, width, height, planes))
+        count = (width + 2) * planes
+        rows = _lane_rows(self.pixels, width, height, planes, 1, 1)
+        results = [bytearray() for _ in range(planes)]
+        for ox, oy in zip(_lane_correlate(rows, height, planes, SOBEL_X),
+                          _lane_correlate(rows, height, planes, SOBEL_Y)):
+            line = bytes([min(255, round(math.sqrt(a**2 + b**2)))
+                          for a, b in zip(_lane_values(ox, count)[:width * planes],
+                                          _lane_values(oy, count)[:width * planes])])
+            for p in range(planes):
+                results[p] += line[p::planes]
+        return ColorImage(width, height, bytearray().join(results))
+
+    def _transposed(self):
+        """
+        Return transposed image (columns become rows)
+        """
+        return ColorImage(self.height, self.width,
+                          _transposed(self.pixels, self.width, self.height, self.CHANNELS))
+
+    def seam_carving(self, n, horizontal=False, batch=1):
+        """
+        Remove n seams of minimum energy, the energy of a pixel being the
+        sum of the edges() values of its channels (see Image.seam_carving)
+        """
+        img = self._transposed() if horizontal else self
+        channels, width = _carve(img, n, batch)
+        result = ColorImage(width, img.height, _channels_pixels(channels))
+        return result._transposed() if horizontal else result
+
+    def seam_insertion(self, n, horizontal=False):
+        """
+        Enlarge image by n columns (rows if horizontal) duplicating the n
+        seams of lowest energy (see _insert_seams)
+        """
+        img = self._transposed() if horizontal else self
+        result = ColorImage(img.width + n, img.height,
+                            _channels_pixels(_insert_seams(img, n)))
+        return result._transposed() if horizontal else result
+
+    def __eq__(self, other):
+        return (isinstance(other, ColorImage)
+                and (self.width, self.height) == (other.width, other.height)
+                and list(self.pixels) == list(other.pixels))
+
+    def __repr__(self):
+        return "ColorImage(%s, %s, %s)" % (self.width, self.height, list(self.pixels))
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Loads a color image from the given file.  Grayscale images get three
+        equal channels
+
+        Invoked as, for example:
+           i = ColorImage.load('test_images/cat.png')
+        """
+        with open(fname, 'rb') as img_handle:
+            img = PILImage.open(img_handle)
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            raw = img.tobytes()
+            w, h = img.size
+            return cls(w, h, bytearray(raw[0::3] + raw[1::3] + raw[2::3]))
+
+    def save(self, fname, mode='PNG'):
+        """
+        Saves the given image to disk or to a file-like object (see
+        Image.save)
+        """
+        size = self.width * self.height
+        planes = self.pixels
+        if not isinstance(planes, bytearray):
+            planes = bytearray(list(planes))
+        raw = bytearray(3 * size)
+        for p in range(self.CHANNELS):
+            raw[p::3] = planes[p*size:(p+1)*size]
+        out = PILImage.frombytes('RGB', (self.width, self.height), bytes(raw))
+        if isinstance(fname, str):
+            out.save(fname)
+        else:
+            out.save(fname, mode)
+        out.close()
+
+
+class Pipeline:
+    """
+    Lazy chain of filters applied to an image
+
+    Steps are only recorded until run(), which fuses them into stages:
+    per-pixel operations (invert, apply, clip) are folded into the padding
+    before a kernel or into the output rows after it, consecutive kernels
+    are composed into one, and every stage materialises a single image.
+    Results rounded to 8 bits (blur, sharpen, edges, clip) are the same as
+    calling the Image methods one by one; unclipped float results of
+    composed kernels may differ from them by floating point rounding error.
+
+    Invoked as, for example:
+        result = im.pipeline().invert().blur(3).sharpen(5).run()
+    """
+    # full-image passes (and allocations) of the Image methods per step
+    EAGER_PASSES = {'map': 1, 'clip': 1, 'kernel': 1, 'edges': 4}
+
+    def __init__(self, image):
+        self.image = image
+        self.steps = []
+        self.stats = {}
+
+    def _add(self, kind, arg):
+        self.steps.append((kind, arg))
+        return self
+
+    def apply(self, func):
+        return self._add('map', func)
+
+    def invert(self):
+        return self.apply(lambda c: 255-c)
+
+    def correlate(self, kernel):
+        return self._add('kernel', kernel)
+
+    def clip(self):
+        return self._add('clip', _clip_value)
+
+    def blur(self, n):
+        return self.correlate(create_blur_kernel(n)).clip()
+
+    def sharpen(self, n):
+        return self.correlate(create_sharpen_kernel(n)).clip()
+
+    def edges(self):
+        return self._add('edges', None)
+
+    def _stages(self):
+        """
+        Group steps into stages (pre, core, kernel, post): per-pixel
+        functions pre and post around core, which is None, 'edges' or list
+        of kernels composed into kernel
+        """
+        stages = []
+        pre = core = kernel = post = None
+        for kind, arg in self.steps:
+            if kind in ('map', 'clip'):
+                if core is None:
+                    pre = _compose_functions(pre, arg)
+                else:
+                    post = _compose_functions(post, arg)
+                continue
+            if kind == 'kernel' and isinstance(core, list) and post is None:
+                composed = _compose_kernels(kernel, arg)
+                if composed is not None:
+                    core.append(arg)
+                    kernel = composed
+                    continue
+            if core is not None:
+                stages.append((pre, core, kernel, post))
+                pre = post = None
+            core = [arg] if kind == 'kernel' else kind
+            kernel = arg if kind == 'kernel' else None
+        if core is not None or pre is not None or not stages:
+            stages.append((pre, core, kernel, post))
+        return stages
+
+    def run(self):
+        """
+        Apply the filters and return resulting image.  Fill stats with
+        numbers of full-image passes and allocations, and how many of them
+        were saved compared to the Image methods
+        """
+        image = self.image
+        passes = 0
+        stages = self._stages()
+        for pre, core, kernel, post in stages:
+            image, stage_passes = self._run_stage(image, pre, core, kernel, post)
+            passes += stage_passes
+        eager = sum(self.EAGER_PASSES[kind] for kind, _ in self.steps)
+        self.stats = {'passes': passes,
+                      'allocations': len(stages),
+                      'passes_saved': eager - passes,
+                      'allocations_saved': eager - len(stages)}
+        return image
+
+    @staticmethod
+    def _run_stage(image, pre, core, kernel, post):
+        """
+        Run one fused stage. Return new image and number of passes made
+        """
+        width, height = image.width, image.height
+        if core is None:
+            func = _compose_functions(pre, post) or (lambda c: c)
+            return Image(width, height, _compact(_map_pixels(image.pixels, func))), 1
+        if core == 'edges':
+            padded = _padded(image.pixels, width, height, 1, 1, pre)
+            rows = ([_clip_value(math.sqrt(a**2 + b**2)) for a, b in zip(ox, oy)]
+                    for ox, oy in zip(_correlate_rows(padded, width, height, SOBEL_X),
+                                      _correlate_rows(padded, width, height, SOBEL_Y)))
+            passes = 2
+        else:
+            center = len(kernel) // 2
+            padded = _padded(image.pixels, width, height,
+                             center, len(kernel) - center - 1, pre)
+            rows = _correlate_rows(padded, width, height, kernel)
+            if len(core) > 1:
+                rows = _sequential_rows(rows, image, pre, core)
+            passes = 1
+        pixels = []
+        for row in rows:
+            pixels.extend(row if post is None else [post(c) for c in row])
+        return Image(width, height, _compact(pixels)), passes
+
+
 try:
     tk_root = tkinter.Tk()
     tk_root.withdraw()
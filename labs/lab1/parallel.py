@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Multi-process execution of lab.Image filters
+
+The image is split into horizontal stripes.  Every worker process reads its
+stripe together with a halo of kernel-radius rows from a shared memory copy
+of the pixels, runs the ordinary serial filter on it and writes the stripe
+rows of the result into a shared output buffer.  Rows outside the image are
+clamped exactly as in the serial code, so the result is identical.
+
+Invoked as, for example:
+    result = parallel.run_filter(img, 'blurred', 5, workers=8)
+"""
+
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import lab
+
+# filters whose result is clipped to 8-bit values
+CLIPPED_FILTERS = ('inverted', 'blurred', 'sharpened', 'edges')
+
+
+def _pixel_format(pixels):
+    """
+    Return memoryview format of shared buffer for the pixels
+    """
+    if all(isinstance(c, int) and 0 <= c <= 255 for c in pixels):
+        return 'B'
+    return 'd'
+
+
+def _fill(view, start, values):
+    """
+    Copy values into the typed memoryview starting at index start
+    """
+    if view.format == 'B':
+        view[start:start + len(values)] = bytearray(values)
+    else:
+        for i, c in enumerate(values, start):
+            view[i] = c
+
+
+def _run_stripe(task):
+    """
+    Apply filter to the rows [y_start, y_stop) of the shared image
+    """
+    (in_name, in_format, out_name, out_format,
+     width, height, y_start, y_stop, halo, name, args) = task
+    source = shared_memory.SharedMemory(name=in_name)
+    target = shared_memory.SharedMemory(name=out_name)
+    in_size = 1 if in_format == 'B' else 8
+    out_size = 1 if out_format == 'B' else 8
+    pixels_in = source.buf[:width * height * in_size].cast(in_format)
+    pixels_out = target.buf[:width * height * out_size].cast(out_format)
+    try:
+        top, bottom = max(y_start - halo, 0), min(y_stop + halo, height)
+        stripe = pixels_in[top * width:bottom * width]
+        pixels = bytearray(stripe) if in_format == 'B' else stripe.tolist()
+        stripe.release()
+        result = getattr(lab.Image(width, bottom - top, pixels), name)(*args)
+        offset = (y_start - top) * width
+        _fill(pixels_out, y_start * width,
+              result.pixels[offset:offset + (y_stop - y_start) * width])
+    finally:
+        pixels_in.release()
+        pixels_out.release()
+        source.close()
+        target.close()
+
+
+def run_filter(image, name, *args, workers=None, stripes=None):
+    """
+    Apply filter (name of the lab.Image method) to the image using a pool
+    of worker processes.  Return a new image
+
+    stripes defaults to four per worker; images with fewer rows than
+    stripes are processed serially.
+    """
+    workers = workers or os.cpu_count() or 1
+    stripes = min(stripes or 4 * workers, image.height)
+    halo = lab.filter_halo(name, *args)
+    if workers == 1 or stripes < 2:
+        return getattr(image, name)(*args)
+
+    in_format = _pixel_format(image.pixels)
+    out_format = 'B' if in_format == 'B' and name in CLIPPED_FILTERS else 'd'
+    count = image.width * image.height
+    source = shared_memory.SharedMemory(
+        create=True, size=max(1, count * (1 if in_format == 'B' else 8)))
+    target = shared_memory.SharedMemory(
+        create=True, size=max(1, count * (1 if out_format == 'B' else 8)))
+    try:
+        view = source.buf[:count * (1 if in_format == 'B' else 8)].cast(in_format)
+        _fill(view, 0, image.pixels)
+        view.release()
+
+        bounds = [image.height * i // stripes for i in range(stripes + 1)]
+        tasks = [(source.name, in_format, target.name, out_format,
+                  image.width, image.height, y_start, y_stop, halo, name, args)
+                 for y_start, y_stop in zip(bounds, bounds[1:])]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_run_stripe, tasks))
+
+        view = target.buf[:count * (1 if out_format == 'B' else 8)].cast(out_format)
+        pixels = bytearray(view) if out_format == 'B' else lab._compact(view.tolist())
+        view.release()
+        return lab.Image(image.width, image.height, pixels)
+    finally:
+        source.close()
+        source.unlink()
+        target.close()
+        target.unlink()
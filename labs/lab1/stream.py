@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Streaming execution of lab.Image filters for images larger than memory
+
+Rows are read one at a time from a PGM, PNG or headerless raw 8-bit
+grayscale file.  Only a window of kernel-size rows (plus a block of output
+rows) is kept: every block is filtered with the ordinary Image methods
+together with a halo of rows around it, and finished output rows are
+written out immediately.  Memory is O(width * kernel size) and the result
+is the same as filtering the whole image.
+
+Invoked as, for example:
+    python3 stream.py scan.png scan_blurred.png blurred 9
+"""
+
+import argparse
+import struct
+import zlib
+
+from collections import deque
+
+import lab
+
+# filters which can be streamed; all of them produce 8-bit images
+STREAM_FILTERS = ('inverted', 'blurred', 'sharpened', 'edges')
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# bytes per pixel of supported 8-bit PNG color types
+PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+# bytes read from a file at once
+READ_SIZE = 1 << 16
+
+
+def _read_exactly(f, n):
+    """
+    Read n bytes from file or raise ValueError
+    """
+    data = f.read(n)
+    if len(data) != n:
+        raise ValueError('Unexpected end of file')
+    return data
+
+
+def read_raw(fname, width, height):
+    """
+    Return (width, height, rows) for a headerless 8-bit grayscale file,
+    rows being an iterator of bytes objects
+    """
+    def rows():
+        with open(fname, 'rb') as f:
+            for _ in range(height):
+                yield _read_exactly(f, width)
+    return width, height, rows()
+
+
+def _pgm_header(f):
+    """
+    Read header of binary PGM file. Return (width, height)
+    """
+    fields = []
+    token = b''
+    while len(fields) < 4:
+        c = _read_exactly(f, 1)
+        if c == b'#':
+            f.readline()
+        elif c.isspace():
+            if token:
+                fields.append(token)
+                token = b''
+        else:
+            token += c
+    if fields[0] != b'P5':
+        raise ValueError('Unsupported PGM format: %r' % fields[0])
+    width, height, maxval = (int(i) for i in fields[1:])
+    if maxval > 255:
+        raise ValueError('Unsupported PGM maxval: %d' % maxval)
+    return width, height
+
+
+def read_pgm(fname):
+    """
+    Return (width, height, rows) for a binary (P5) 8-bit PGM file
+    """
+    with open(fname, 'rb') as f:
+        width, height = _pgm_header(f)
+
+    def rows():
+        with open(fname, 'rb') as f:
+            _pgm_header(f)
+            for _ in range(height):
+                yield _read_exactly(f, width)
+    return width, height, rows()
+
+
+def _png_chunks(f):
+    """
+    Yield (type, data) of PNG chunks
+    """
+    while True:
+        length, kind = struct.unpack('>I4s', _read_exactly(f, 8))
+        data = _read_exactly(f, length)
+        _read_exactly(f, 4)
+        yield kind, data
+        if kind == b'IEND':
+            return
+
+
+def _unfilter(kind, line, prior, bpp):
+    """
+    Undo PNG filter of one scanline given the previous reconstructed one
+    """
+    if kind == 0:
+        return line
+    if kind == 2:
+        return bytearray((a + b) & 0xff for a, b in zip(line, prior))
+    out = bytearray(line)
+    for i in range(len(out)):
+        left = out[i - bpp] if i >= bpp else 0
+        if kind == 1:
+            out[i] = (out[i] + left) & 0xff
+        elif kind == 3:
+            out[i] = (out[i] + ((left + prior[i]) >> 1)) & 0xff
+        elif kind == 4:
+            upper_left = prior[i - bpp] if i >= bpp else 0
+            p = left + prior[i] - upper_left
+            pa, pb, pc = abs(p - left), abs(p - prior[i]), abs(p - upper_left)
+            if pa <= pb and pa <= pc:
+                predictor = left
+            elif pb <= pc:
+                predictor = prior[i]
+            else:
+                predictor = upper_left
+            out[i] = (out[i] + predictor) & 0xff
+        else:
+            raise ValueError('Unknown PNG filter type: %d' % kind)
+    return out
+
+
+def read_png(fname):
+    """
+    Return (width, height, rows) for an 8-bit non-interlaced PNG file.
+    Color rows are converted to grayscale as in lab.Image.load
+    """
+    with open(fname, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError('Not a PNG file: %r' % fname)
+        kind, data = next(_png_chunks(f))
+    width, height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', data)
+    if depth != 8 or color not in PNG_CHANNELS or interlace:
+        raise ValueError('Unsupported PNG format: depth %d, color type %d' % (depth, color))
+    bpp = PNG_CHANNELS[color]
+    stride = width * bpp
+
+    def gray(line):
+        if color == 0:
+            return bytes(line)
+        if color == 4:
+            return bytes(line[0::2])
+        return bytes(lab._gray_from_rgb(line, bpp))
+
+    def rows():
+        decompressor = zlib.decompressobj()
+        pending = bytearray()
+        prior = bytes(stride)
+        count = 0
+        with open(fname, 'rb') as f:
+            f.read(8)
+            for kind, data in _png_chunks(f):
+                if kind != b'IDAT':
+                    continue
+                pending += decompressor.decompress(data)
+                while len(pending) > stride and count < height:
+                    prior = _unfilter(pending[0], pending[1:stride + 1], prior, bpp)
+                    del pending[:stride + 1]
+                    count += 1
+                    yield gray(prior)
+        if count < height:
+            raise ValueError('Truncated PNG image data')
+    return width, height, rows()
+
+
+def read_rows(fname, size=None):
+    """
+    Return (width, height, rows) of the image file.  size=(width, height)
+    marks a headerless raw file
+    """
+    if size is not None:
+        return read_raw(fname, *size)
+    with open(fname, 'rb') as f:
+        magic = f.read(8)
+    if magic == PNG_SIGNATURE:
+        return read_png(fname)
+    if magic[:2] == b'P5':
+        return read_pgm(fname)
+    raise ValueError('Unsupported image file: %r' % fname)
+
+
+def _png_chunk(kind, data):
+    """
+    Return bytes of PNG chunk
+    """
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data)))
+
+
+def write_rows(fname, width, height, rows):
+    """
+    Write 8-bit grayscale rows into a PNG, PGM or (any other extension) raw
+    file as they come
+    """
+    with open(fname, 'wb') as f:
+        if fname.lower().endswith('.png'):
+            f.write(PNG_SIGNATURE)
+            f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+            compressor = zlib.compressobj()
+            pending = b''
+            for row in rows:
+                pending += compressor.compress(b'\0' + bytes(row))
+                if len(pending) >= READ_SIZE:
+                    f.write(_png_chunk(b'IDAT', pending))
+                    pending = b''
+            f.write(_png_chunk(b'IDAT', pending + compressor.flush()))
+            f.write(_png_chunk(b'IEND', b''))
+            return
+        if fname.lower().endswith(('.pgm', '.pnm')):
+            f.write(b'P5\n%d %d\n255\n' % (width, height))
+        for row in rows:
+            f.write(bytes(row))
+
+
+def filter_rows(rows, width, height, name, *args, block=None):
+    """
+    Yield rows of the image filtered by the Image method name, reading the
+    input rows lazily
+
+    Rows are filtered block rows at a time (default kernel size) together
+    with a halo of rows above and below the block; only these rows are kept.
+    """
+    if name not in STREAM_FILTERS:
+        raise ValueError('Unsupported filter: %r' % name)
+    halo = lab.filter_halo(name, *args)
+    block = block or 2 * halo + 1
+    rows = iter(rows)
+    window = deque()
+    first = read = 0
+    for y_start in range(0, height, block):
+        y_stop = min(y_start + block, height)
+        while read < min(y_stop + halo, height):
+            window.append(next(rows))
+            read += 1
+        while first < max(y_start - halo, 0):
+            window.popleft()
+            first += 1
+        stripe = lab.Image(width, len(window), bytearray(b''.join(window)))
+        result = getattr(stripe, name)(*args)
+        for y in range(y_start - first, y_stop - first):
+            yield result.pixels[y * width:(y + 1) * width]
+
+
+def stream_filter(source, target, name, *args, size=None, block=None):
+    """
+    Filter image file source into file target without loading it whole
+    """
+    width, height, rows = read_rows(source, size)
+    write_rows(target, width, height,
+               filter_rows(rows, width, height, name, *args, block=block))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('source', help='PNG, PGM or raw input file')
+    parser.add_argument('target', help='output file (.png, .pgm or raw)')
+    parser.add_argument('filter', choices=STREAM_FILTERS)
+    parser.add_argument('n', nargs='?', type=int,
+                        help='kernel size of blurred and sharpened')
+    parser.add_argument('--size', help='WIDTHxHEIGHT of a raw input file')
+    parser.add_argument('--block', type=int, help='rows filtered at once')
+    args = parser.parse_args()
+    size = tuple(int(i) for i in args.size.split('x')) if args.size else None
+    params = (args.n,) if args.filter in ('blurred', 'sharpened') else ()
+    stream_filter(args.source, args.target, args.filter, *params,
+                  size=size, block=args.block)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
 
 import os
+import batch
+import benchmark
+import cache
+import json
 import lab
+import parallel
+import stream
+import tempfile
 import unittest
 
+from PIL import Image as PILImage
+
 TEST_DIRECTORY = os.path.dirname(__file__)
 
 
@@ -24,6 +33,34 @@ class TestImage(unittest.TestCase):
                               0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0])
         self.assertEqual(result, expected)
 
+    def test_compact_storage(self):
+        im = lab.Image(4, 1, [24, 93, 140, 197])
+        compact = im.compacted()
+        self.assertIsInstance(compact.pixels, bytearray)
+        self.assertEqual(compact, im)
+        result = compact.correlate(((0, 0, 0), (0.5, 0.5, 0), (0, 0, 0)))
+        self.assertEqual(result.pixels.format, 'd')
+        self.assertEqual(result, lab.Image(4, 1, [24.0, 58.5, 116.5, 168.5]))
+        self.assertIsInstance(result._clip().pixels, bytearray)
+        self.assertFalse(hasattr(im, '__dict__'))
+
+    def test_gray_from_rgb(self):
+        colors = [(r, g, b) for r in range(0, 256, 7)
+                  for g in range(0, 256, 7) for b in range(0, 256, 7)]
+        raw = bytes(c for rgb in colors for c in rgb)
+        result = lab._gray_from_rgb(raw, 3)
+        expected = bytearray(round(.299*r + .587*g + .114*b) for r, g, b in colors)
+        self.assertEqual(result, expected)
+
+    def test_save(self):
+        im = lab.Image.load('test_images/pattern.png')
+        for pixels in (im.pixels, list(im.pixels)):
+            with self.subTest(t=type(pixels).__name__):
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    fname = os.path.join(tmpdir, 'pattern.png')
+                    lab.Image(im.width, im.height, pixels).save(fname)
+                    self.assertEqual(lab.Image.load(fname), im)
+
 
 class TestInverted(unittest.TestCase):
     def test_inverted_1(self):
@@ -58,6 +95,18 @@ class TestInverted(unittest.TestCase):
                 expected = lab.Image.load(expfile)
                 self.assertEqual(result,  expected)
 
+    def test_apply_per_pixel(self):
+        im = lab.Image(3, 2, [0, 10, 10, 255, 128, 0])
+        calls = []
+        result = im.apply_per_pixel(lambda c: calls.append(c) or c // 2)
+        self.assertEqual(result, lab.Image(3, 2, [0, 5, 5, 127, 64, 0]))
+        self.assertIsInstance(result.pixels, bytearray)
+        self.assertEqual(sorted(calls), [0, 10, 128, 255])
+        result = im.apply_per_pixel(lambda c: c / 2)
+        self.assertEqual(result, lab.Image(3, 2, [0, 5, 5, 127.5, 64, 0]))
+        result = result.apply_per_pixel(lambda c: c * 2 - 1)
+        self.assertEqual(result, lab.Image(3, 2, [-1, 9, 9, 254, 127, -1]))
+
 
 class TestPixels(unittest.TestCase):
     def test_get_unbounded_pixel(self):
@@ -71,6 +120,25 @@ class TestPixels(unittest.TestCase):
                 result = im.get_unbounded_pixel(x, y)
                 self.assertEqual(result, value)
 
+    def test_empty_images(self):
+        for width, height in ((3, 0), (0, 3), (0, 0)):
+            im = lab.Image(width, height, [])
+            for result in (im.blurred(3), im.sharpened(3), im.edges(),
+                           im.correlate(((0.5, 2), (3, 4)))):
+                self.assertEqual((result.width, result.height, len(result.pixels)),
+                                 (width, height, 0))
+
+    def test_set_pixel(self):
+        im = lab.Image.load(os.path.join(TEST_DIRECTORY, 'test_images', 'pattern.png'))
+        expected = list(im.pixels)
+        for c in (300, 1.5, -7, 12):
+            im.set_pixel(1, 0, c)
+            expected[1] = c
+            self.assertEqual(list(im.pixels), expected)
+        im = im.correlate(((2,),))
+        im.set_pixel(0, 0, 0.25)
+        self.assertEqual(im.get_pixel(0, 0), 0.25)
+
 
 class TestCorrelation(unittest.TestCase):
     def test_correlate(self):
@@ -96,6 +164,46 @@ class TestCorrelation(unittest.TestCase):
                 self.assertEqual(img, img_copy, "Be careful not to modify theo original image!")
                 self.assertEqual(result, expected)
 
+    def test_correlate_fast_paths(self):
+        sharpen = lab.create_blur_kernel(4, -1)
+        sharpen[2][2] += 2
+        kernels = {"box_even": lab.create_blur_kernel(4),
+                   "box_odd": lab.create_blur_kernel(5),
+                   "sharpen": sharpen,
+                   "sobel": ((-1, 0, 1), (-2, 0, 2), (-1, 0, 1))}
+        img = lab.Image.load("test_images/pattern.png")
+        for kernel_name, kernel in kernels.items():
+            with self.subTest(k=kernel_name):
+                result = img.correlate(kernel)._clip()
+                expected = img._correlate_direct(kernel)._clip()
+                self.assertEqual(result, expected)
+
+    def test_correlate_fixed_point(self):
+        img = lab.Image.load("test_images/pattern.png")
+        for n in (2, 3, 6):
+            with self.subTest(n=n):
+                kernel = lab.create_sharpen_kernel(n)
+                result = img.correlate(kernel, fixed_point=n*n)
+                expected = lab.Image(img.width, img.height,
+                                     [round(c) for c in img.correlate(kernel).pixels])
+                self.assertEqual(result, expected)
+                self.assertIsInstance(result.pixels[0], int)
+        result = lab.Image(4, 1, [1, 2, 3, 5]).correlate(((0, 0, 0), (0.5, 0.5, 0), (0, 0, 0)),
+                                                        fixed_point=2)
+        self.assertEqual(result, lab.Image(4, 1, [1, 2, 2, 4]))
+        self.assertRaises(ValueError, img.correlate, lab.create_blur_kernel(3), fixed_point=8)
+
+    def test_correlate_padded(self):
+        kernel = ((0.5, -1.25, 0.0, 0.1),
+                  (0.3, 0.7, -0.2, 0.0),
+                  (0.0, 0.9, 1.5, -0.4),
+                  (0.2, 0.0, 0.1, 0.6))
+        img = lab.Image(5, 3, [12.5, 8, 215, 64, 3.25, 210, 45, 110, 76, 0,
+                               85, 90.75, 12, 150, 255])
+        result = img.correlate(kernel)
+        expected = img._correlate_direct(kernel)
+        self.assertEqual(result, expected)
+
 
 class TestFilters(unittest.TestCase):
     def test_blurred(self):
@@ -151,6 +259,21 @@ class TestRetarget(unittest.TestCase):
         expected = lab.Image(3, 3, [12, 215, 64, 210, 110, 76, 85, 12, 150])
         self.assertEqual(result, expected)
 
+    def test_remove_columns(self):
+        result = self.img
+        result._remove_columns({0, 2})
+        expected = lab.Image(2, 3, [8, 64, 45, 76, 90, 150])
+        self.assertEqual(result, expected)
+
+    def test_retarget(self):
+        inpfile = os.path.join(TEST_DIRECTORY, 'test_images', 'blob.png')
+        img = lab.Image.load(inpfile)
+        result = img.retarget(20)
+        expected = lab.Image(img.width, img.height, list(img.pixels))
+        for _ in range(20):
+            expected._remove_column(expected.edges()._find_min_column())
+        self.assertEqual(result, expected)
+
     def test_get_cumulative_map(self):
         result = self.img
         result._get_cumulative_map()
@@ -167,5 +290,349 @@ class TestRetarget(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class TestSeamCarving(unittest.TestCase):
+    def test_incremental(self):
+        for fname, n in (('pattern', 5), ('blob', 12)):
+            with self.subTest(f=fname):
+                inpfile = os.path.join(TEST_DIRECTORY, 'test_images', '%s.png' % fname)
+                img = lab.Image.load(inpfile)
+                result = img.seam_carving(n)
+                expected = img.seam_carving(n, incremental=False)
+                self.assertEqual(result, expected)
+
+    def test_horizontal(self):
+        img = lab.Image.load(os.path.join(TEST_DIRECTORY, 'test_images', 'pattern.png'))
+        result = img.seam_carving(3, horizontal=True)
+        transposed = lab.Image(img.height, img.width, [img.get_pixel(x, y) for x in range(img.width)
+                                                       for y in range(img.height)])
+        carved = transposed.seam_carving(3, incremental=False)
+        expected = lab.Image(carved.height, carved.width,
+                             [carved.get_pixel(x, y) for x in range(carved.width)
+                              for y in range(carved.height)])
+        self.assertEqual(result, expected)
+
+    def test_batch(self):
+        img = lab.Image.load(os.path.join(TEST_DIRECTORY, 'test_images', 'blob.png'))
+        self.assertEqual(img.seam_carving(4, batch=1, incremental=False), img.seam_carving(4))
+        energy = img.edges()
+        back = energy._get_cumulative_map()
+        cost = [energy.pixels[y*img.width:(y+1)*img.width] for y in range(img.height)]
+        paths = lab._trace_seams(cost, back, 5)
+        self.assertEqual(paths[0], energy._get_min_path(back))
+        self.assertEqual(len({(x, y) for path in paths for y, x in enumerate(path)}),
+                         5 * img.height)
+        result = img.seam_carving(5, batch=5)
+        self.assertEqual(result, lab.Image(img.width - 5, img.height,
+                                           [c for i, c in enumerate(img.pixels)
+                                            if i % img.width not in
+                                            {path[i // img.width] for path in paths}]))
+
+    def test_insertion(self):
+        img = lab.Image(4, 3, [12, 8, 215, 64, 210, 45, 110, 76, 85, 90, 12, 150])
+        energy = img.edges()
+        energy._get_cumulative_map()
+        path = energy._get_min_path()
+        pixels = []
+        for y, x in enumerate(path):
+            row = [img.get_pixel(i, y) for i in range(4)]
+            row.insert(x + 1, round((row[x] + row[min(x + 1, 3)]) / 2))
+            pixels.extend(row)
+        self.assertEqual(img.seam_insertion(1), lab.Image(5, 3, pixels))
+        result = img.seam_insertion(2, horizontal=True)
+        self.assertEqual((result.width, result.height), (4, 5))
+        self.assertRaises(ValueError, img.seam_insertion, 4)
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.img = lab.Image.load(os.path.join(TEST_DIRECTORY, 'test_images', 'chess.png'))
+
+    def test_filters(self):
+        pipeline = self.img.pipeline().invert().blur(3).sharpen(5).edges()
+        result = pipeline.run()
+        expected = self.img.inverted().blurred(3).sharpened(5).edges()
+        self.assertEqual(result, expected)
+        self.assertEqual(pipeline.stats['allocations'], 3)
+        self.assertEqual(pipeline.stats['allocations_saved'], 6)
+
+    def test_composed_kernels(self):
+        img = self.img._crop(100, 80, 140, 110)
+        kernel = ((0.25, -0.5, 0.1),
+                  (0.3, 1.2, -0.2),
+                  (0.0, 0.4, 0.15))
+        pipeline = img.pipeline().correlate(kernel).correlate(lab.create_blur_kernel(4)).clip()
+        result = pipeline.run()
+        expected = img.correlate(kernel).correlate(lab.create_blur_kernel(4))._clip()
+        self.assertEqual(result, expected)
+        self.assertEqual(pipeline.stats['passes'], 1)
+
+    def test_composed_unit_kernels(self):
+        img = self.img._crop(100, 80, 107, 85)
+        for first, second in (([[1]], [[1]]), ([[0]], [[1]]), ([[0.5]], [[3]])):
+            result = img.pipeline().correlate(first).correlate(second).run()
+            self.assertEqual(result, img.correlate(first).correlate(second))
+
+
+class TestParallel(unittest.TestCase):
+    def test_run_filter(self):
+        img = lab.Image.load(os.path.join(TEST_DIRECTORY, 'test_images', 'mushroom.png'))
+        average = ((0.0, 0.2, 0.0),
+                   (0.2, 0.2, 0.2),
+                   (0.0, 0.2, 0.0))
+        for name, args in (('inverted', ()), ('blurred', (4,)), ('sharpened', (5,)),
+                           ('edges', ()), ('correlate', (average,))):
+            with self.subTest(f=name):
+                result = parallel.run_filter(img, name, *args, workers=2, stripes=5)
+                expected = getattr(img, name)(*args)
+                self.assertEqual(result, expected)
+
+
+class TestStream(unittest.TestCase):
+    def test_read_png(self):
+        for fname in ('cat.png', 'pattern.png'):
+            with self.subTest(f=fname):
+                path = os.path.join(TEST_DIRECTORY, 'test_images', fname)
+                width, height, rows = stream.read_rows(path)
+                expected = lab.Image.load(path)
+                self.assertEqual(lab.Image(width, height, bytearray(b''.join(rows))), expected)
+
+    def test_stream_filter(self):
+        source = os.path.join(TEST_DIRECTORY, 'test_images', 'mushroom.png')
+        img = lab.Image.load(source)
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, args, ext in (('blurred', (5,), '.png'), ('sharpened', (3,), '.pgm'),
+                                    ('edges', (), '.png'), ('inverted', (), '.raw')):
+                with self.subTest(f=name):
+                    target = os.path.join(tmp, name + ext)
+                    stream.stream_filter(source, target, name, *args, block=4)
+                    size = (img.width, img.height) if ext == '.raw' else None
+                    width, height, rows = stream.read_rows(target, size)
+                    result = lab.Image(width, height, bytearray(b''.join(rows)))
+                    self.assertEqual(result, getattr(img, name)(*args))
+
+
+class TestBatch(unittest.TestCase):
+    def test_parse_spec(self):
+        result = batch.parse_spec('invert, blur:3,seam:2')
+        expected = [('inverted', ()), ('blurred', (3,)), ('seam_carving', (2,))]
+        self.assertEqual(result, expected)
+        for spec in ('blur', 'edges:2', 'sepia'):
+            with self.subTest(s=spec):
+                self.assertRaises(ValueError, batch.parse_spec, spec)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([batch.percentile(values, p) for p in (50, 90, 99, 100)],
+                         [50, 90, 99, 100])
+
+    def test_run_batch(self):
+        names = ('centered_pixel', 'pattern', 'bluegill')
+        steps = batch.parse_spec('invert,blur:3')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = os.path.join(tmpdir, 'manifest.txt')
+            with open(manifest, 'w') as f:
+                for name in names:
+                    f.write(os.path.join(os.path.abspath(TEST_DIRECTORY),
+                                         'test_images', name + '.png') + '\n')
+            out_dir = os.path.join(tmpdir, 'out')
+            stats = batch.run_batch(batch.list_images(manifest), out_dir, steps, workers=2)
+            self.assertEqual(stats['images'], 3)
+            for name in names:
+                with self.subTest(f=name):
+                    inpfile = os.path.join(TEST_DIRECTORY, 'test_images', name + '.png')
+                    expected = lab.Image.load(inpfile).inverted().blurred(3)
+                    result = lab.Image.load(os.path.join(out_dir, name + '.png'))
+                    self.assertEqual(result, expected)
+
+    def test_output_names(self):
+        sources = ['a/x.png', 'b/x.png', 'a/x.jpg', 'x-2.gif', 'X.bmp', 'y.png']
+        self.assertEqual(batch.output_names(sources),
+                         ['x.png', 'x-2.png', 'x-3.png', 'x-2-2.png', 'X-4.png', 'y.png'])
+        source = os.path.join(TEST_DIRECTORY, 'test_images', 'pattern.png')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            out_dir = os.path.join(tmpdir, 'out')
+            stats = batch.run_batch([source, source], out_dir, batch.parse_spec('invert'))
+            self.assertEqual(stats['succeeded'], 2)
+            self.assertEqual(sorted(os.listdir(out_dir)), ['pattern-2.png', 'pattern.png'])
+
+    def test_failures(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source = os.path.join(TEST_DIRECTORY, 'test_images', 'pattern.png')
+            broken = os.path.join(tmpdir, 'broken.png')
+            with open(broken, 'wb') as f:
+                f.write(b'not an image')
+            out_dir = os.path.join(tmpdir, 'out')
+            stats = batch.run_batch([broken, source], out_dir, batch.parse_spec('invert'),
+                                    workers=2)
+            self.assertEqual((stats['images'], stats['succeeded'], stats['failed']), (2, 1, 1))
+            self.assertEqual([failure[0] for failure in stats['failures']], [broken])
+            self.assertEqual(os.listdir(out_dir), ['pattern.png'])
+
+    def test_palette_images(self):
+        rgb = PILImage.open(os.path.join(TEST_DIRECTORY, 'test_images', 'cat.png')).convert('RGB')
+        palette = rgb.convert('P')
+        with tempfile.TemporaryDirectory() as tmpdir:
+            palette.convert('RGB').save(os.path.join(tmpdir, 'expected.png'))
+            expected = lab.Image.load(os.path.join(tmpdir, 'expected.png'))
+            for fname in ('cat.gif', 'cat.png'):
+                with self.subTest(f=fname):
+                    palette.save(os.path.join(tmpdir, fname))
+                    self.assertEqual(batch.load_image(os.path.join(tmpdir, fname)), expected)
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.img = lab.Image.load(os.path.join(TEST_DIRECTORY, 'test_images', 'pattern.png'))
+
+    def test_tiers(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = cache.ResultCache(tmpdir)
+            for _ in range(2):
+                self.assertEqual(results.apply(self.img, 'blurred', 3), self.img.blurred(3))
+            self.assertEqual(results.stats['misses'], 1)
+            self.assertEqual(results.stats['memory_hits'], 1)
+            results = cache.ResultCache(tmpdir)
+            self.assertEqual(results.apply(self.img, 'blurred', 3), self.img.blurred(3))
+            self.assertEqual(results.apply(self.img, 'blurred', 5), self.img.blurred(5))
+            self.assertEqual(results.stats['disk_hits'], 1)
+            self.assertEqual(results.stats['misses'], 1)
+            correlated = self.img.correlate(((0.5, 0.25),
+                                             (0.25, 0.0)))
+            results.put('float', correlated)
+            results._memory.clear()
+            self.assertEqual(results.get('float'), correlated)
+
+    def test_eviction(self):
+        entry = len(self.img.pixels)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = cache.ResultCache(tmpdir, memory_bytes=2 * entry,
+                                        disk_bytes=3 * (entry + cache.HEADER.size))
+            for n in range(1, 5):
+                results.put(str(n), self.img)
+            self.assertEqual(list(results._memory), ['3', '4'])
+            self.assertEqual(sorted(os.listdir(tmpdir)), ['2.img', '3.img', '4.img'])
+            self.assertIsNone(results.get('1'))
+
+    def test_mapped_reads(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = cache.ResultCache(tmpdir)
+            results.put('img', self.img)
+            results.put('bad', self.img)
+            results._memory.clear()
+            with open(os.path.join(tmpdir, 'bad.img'), 'r+b') as f:
+                f.write(b'XXXX')
+            result = results.get('img')
+            self.assertEqual(result, self.img)
+            self.assertIsInstance(result.pixels, memoryview)
+            result.set_pixel(0, 0, 300)
+            self.assertEqual(result.get_pixel(0, 0), 300)
+            self.assertEqual(results.get('img'), self.img)
+            self.assertIsNone(results.get('bad'))
+            self.assertEqual(os.listdir(tmpdir), ['img.img'])
+            self.assertFalse(results.contains('bad'))
+
+    def test_seam_carving_resume(self):
+        results = cache.ResultCache()
+        self.assertEqual(results.seam_carving(self.img, 3, checkpoint=2),
+                         self.img.seam_carving(3))
+        results._memory.pop(cache.result_key(cache.image_digest(self.img), 'seam_carving', (3,)))
+        result = results.seam_carving(self.img, 5, checkpoint=2)
+        self.assertEqual(result, self.img.seam_carving(5))
+        self.assertEqual(results.stats['memory_hits'], 1)
+        self.assertEqual(results.stats['misses'], 1)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_suite(self):
+        cases = list(benchmark.benchmark_cases((16, 32), (3,), ('blurred', 'seam_carving'),
+                                               max_carve_size=16))
+        self.assertEqual([case[0] for case in cases],
+                         ['blurred(3) 16x16', 'seam_carving 16x16', 'blurred(3) 32x32'])
+        report = benchmark.run_suite(cases, repeat=1)
+        self.assertEqual([result['name'] for result in report['results']],
+                         [case[0] for case in cases])
+        for result in report['results']:
+            self.assertGreater(result['seconds'], 0)
+            self.assertGreater(result['peak_bytes'], 0)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'report.json')
+            with open(fname, 'w') as f:
+                json.dump(report, f)
+            self.assertEqual(benchmark.load_report(fname), report)
+
+    def test_compare(self):
+        def report(seconds, peak):
+            return {'version': 1, 'results': [{'name': 'edges 64x64', 'seconds': seconds,
+                                               'peak_bytes': peak}]}
+        self.assertEqual(benchmark.compare_reports(report(1.0, 100), report(1.05, 105)), [])
+        self.assertEqual(benchmark.compare_reports(report(1.0, 100), report(1.2, 200)),
+                         [('edges 64x64', 'seconds', 1.0, 1.2),
+                          ('edges 64x64', 'peak_bytes', 100, 200)])
+        self.assertEqual(benchmark.compare_reports(report(0.0001, None), report(0.0005, 100)), [])
+
+
+class TestColorImage(unittest.TestCase):
+    def setUp(self):
+        self.img = lab.ColorImage.load(os.path.join(TEST_DIRECTORY, 'test_images', 'cat.png'))
+        self.channels = [self.img.channel(p) for p in range(3)]
+
+    def test_filters(self):
+        for name, args in (('inverted', ()), ('blurred', (3,)), ('blurred', (6,)),
+                           ('sharpened', (5,)), ('edges', ()),
+                           ('correlate', (lab.create_blur_kernel(2),))):
+            with self.subTest(f=name, a=args):
+                result = getattr(self.img, name)(*args)
+                expected = lab.ColorImage.from_channels(
+                    *(getattr(c, name)(*args) for c in self.channels))
+                self.assertEqual(result, expected)
+
+    def test_empty_images(self):
+        for width, height in ((3, 0), (0, 3), (0, 0)):
+            im = lab.ColorImage(width, height, bytearray())
+            for result in (im.blurred(3), im.sharpened(3), im.edges()):
+                self.assertEqual((result.width, result.height, len(result.pixels)),
+                                 (width, height, 0))
+
+    def test_set_pixel(self):
+        im = lab.ColorImage(2, 1, bytearray(6))
+        im.set_pixel(1, 0, (1, 2, 3))
+        self.assertIsInstance(im.pixels, bytearray)
+        im.set_pixel(0, 0, (300, 1.5, -1))
+        self.assertEqual(list(im.pixels), [300, 1, 1.5, 2, -1, 3])
+        self.assertEqual(im.get_pixel(0, 0), (300, 1.5, -1))
+
+    def test_equality(self):
+        gray = lab.Image(2, 2, [1, 2, 3, 4])
+        color = lab.ColorImage(2, 2, bytearray([1, 2, 3, 4]))
+        self.assertNotEqual(gray, color)
+        self.assertNotEqual(color, gray)
+        self.assertEqual(gray, lab.Image(2, 2, bytearray([1, 2, 3, 4])))
+
+    def test_seam_carving(self):
+        width, height = 40, 30
+        channels = [lab.Image(width, height, [c.get_pixel(x, y) for y in range(height)
+                                              for x in range(width)])
+                    for c in self.channels]
+        img = lab.ColorImage.from_channels(*channels)
+        result = img.seam_carving(4)
+        for _ in range(4):
+            edges = [c.edges() for c in channels]
+            energy = lab.Image(width, height, [sum(e) for e in zip(*(e.pixels for e in edges))])
+            energy._get_cumulative_map()
+            path = energy._get_min_path()
+            for c in channels:
+                c.pixels = [c.get_pixel(x, y) for y in range(height)
+                            for x in range(width) if path[y] != x]
+                c.width -= 1
+            width -= 1
+        self.assertEqual(result, lab.ColorImage.from_channels(*channels))
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'cat.png')
+            self.img.save(fname)
+            self.assertEqual(lab.ColorImage.load(fname), self.img)
+
+
 if __name__ == '__main__':
     res = unittest.main(verbosity=3, exit=False)
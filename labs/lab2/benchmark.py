@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark of lab.get_path against the former single-source search
+
+For every query both searches run on the same lab.ActorGraph.  The best wall
+time and the number of actors whose neighbors were looked at are reported.
+
+Invoked as, for example:
+    python3 benchmark.py --data resources/large.json --random 20
+"""
+
+import argparse
+import json
+import random
+import time
+
+import lab
+
+# (actor, actor) name pairs queried by default, taken from lab.py
+QUERIES = (('Kevin Bacon', 'Rube Miller'),
+           ('Venice Hayes', 'Ellen Page'),
+           ('Meryl Streep', 'Iva Ilakovac'))
+
+
+class CountingGraph(dict):
+    """Actor adjacency which counts the actors looked up by get"""
+
+    def __init__(self, neighbors):
+        super().__init__(neighbors)
+        self.touched = 0
+
+    def get(self, key, default=None):
+        self.touched += 1
+        return super().get(key, default)
+
+
+def single_source_path(data, actor_id_1, actor_id_2):
+    """Return path from actor_1 to actor_2 by the former single-source
+    breadth-first search, which copies the whole path of every actor"""
+    graph = lab.get_actor_graph(data)
+    fringe = {actor_id_1}
+    next_fringe = set()
+    paths = {actor_id_1: [actor_id_1]}
+    if actor_id_2 == actor_id_1:
+        return paths[actor_id_1]
+    while fringe:
+        for node in fringe:
+            children = graph.get(node, set())
+            if actor_id_2 in children:
+                return paths[node] + [actor_id_2]
+            for child in children:
+                if child not in paths:
+                    next_fringe.add(child)
+                    paths[child] = paths[node] + [child]
+        fringe = next_fringe
+        next_fringe = set()
+
+
+def measure(search, graph, actor_id_1, actor_id_2, repeat):
+    """Return (path, best seconds, actors touched) of search on ActorGraph"""
+    neighbors = graph.neighbors
+    graph.neighbors = counting = CountingGraph(neighbors)
+    best = float('inf')
+    try:
+        for _ in range(repeat):
+            counting.touched = 0
+            start = time.perf_counter()
+            path = search(graph, actor_id_1, actor_id_2)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        graph.neighbors = neighbors
+    return path, best, counting.touched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data', default='resources/large.json')
+    parser.add_argument('--names', default='resources/names.json')
+    parser.add_argument('--random', type=int, default=10,
+                        help='number of random actor pairs queried')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.data) as f:
+        graph = lab.ActorGraph(json.load(f))
+    with open(args.names) as f:
+        names = json.load(f)
+    queries = [(names[name_1], names[name_2]) for name_1, name_2 in QUERIES
+               if names.get(name_1) in graph.neighbors and names.get(name_2) in graph.neighbors]
+    actors = sorted(graph.neighbors)
+    rng = random.Random(0)
+    queries += [(rng.choice(actors), rng.choice(actors)) for _ in range(args.random)]
+
+    print('%-20s %5s %12s %10s %12s %10s'
+          % ('query', 'hops', 'single s', 'touched', 'bidir s', 'touched'))
+    totals = [0, 0, 0, 0]
+    for actor_id_1, actor_id_2 in queries:
+        before, before_s, before_n = measure(single_source_path, graph,
+                                             actor_id_1, actor_id_2, args.repeat)
+        after, after_s, after_n = measure(lab.get_path, graph,
+                                          actor_id_1, actor_id_2, args.repeat)
+        if (before is None) != (after is None) or before and len(before) != len(after):
+            raise AssertionError('Paths differ: %r %r' % (before, after))
+        hops = '-' if after is None else str(len(after) - 1)
+        print('%-20s %5s %12.6f %10d %12.6f %10d'
+              % ('%d-%d' % (actor_id_1, actor_id_2), hops, before_s, before_n, after_s, after_n))
+        for i, value in enumerate((before_s, before_n, after_s, after_n)):
+            totals[i] += value
+    print('%-20s %5s %12.6f %10d %12.6f %10d' % ('total', '', *totals))
+
+
+if __name__ == '__main__':
+    main()
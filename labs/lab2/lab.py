@@ -3,15 +3,428 @@
 import json
 
 BACON_NUMBER = 4724
+# distance of unreachable actors in ActorGraph distance arrays
+UNREACHABLE = 255
+
+
+class ActorGraph:
+    """Graph of actors built once from [actor, actor, movie] triples
+
+    neighbors maps an actor to the set of actors they acted with, movies
+    maps an unordered pair of actors (frozenset) to the list of their
+    common movies in data order (of the first triple of every movie).
+    actors lists all actors and index maps an actor to its position there.
+    names and movie_names optionally map names to ids (as in names.json and
+    movies.json); ids and movie_ids are the inverse maps.
+
+    Breadth-first searches from a source are kept for the cache_size most
+    recently used sources (see distance_index); cache_size=0 turns this off.
+    """
+
+    def __init__(self, data, names=None, movie_names=None, cache_size=8):
+        # a single pass, so that data can be an iterator (see read_triples)
+        self.neighbors = {}
+        self.movies = {}
+        rank = {}
+        for id_1, id_2, movie in data:
+            self.neighbors.setdefault(id_1, set()).add(id_2)
+            self.neighbors.setdefault(id_2, set()).add(id_1)
+            rank.setdefault(movie, len(rank))
+            movies = self.movies.setdefault(frozenset((id_1, id_2)), [])
+            if movie not in movies:
+                movies.append(movie)
+        for movies in self.movies.values():
+            if len(movies) > 1:
+                movies.sort(key=rank.__getitem__)
+        self.actors = list(self.neighbors)
+        self.index = {actor: i for i, actor in enumerate(self.actors)}
+        self._set_names(names, movie_names, cache_size)
+
+    def _set_names(self, names, movie_names, cache_size):
+        self.names = names or {}
+        self.ids = invert_dict(self.names)
+        self.movie_names = movie_names or {}
+        self.movie_ids = invert_dict(self.movie_names)
+        self.cache_size = cache_size
+        # source: (levels, distances, parents), least recently used first
+        self._distance_indexes = {}
+
+    # Searches run on nodes of the adjacency, which are the actor ids here
+    def _adjacency(self):
+        """Return mapping of a node to its neighbor nodes"""
+        return self.neighbors
+
+    def _node(self, actor_id):
+        """Return node of actor, or None if not in the graph"""
+        return actor_id if actor_id in self.neighbors else None
+
+    def _actor_ids(self, nodes):
+        """Return list of actor ids of nodes"""
+        return list(nodes)
+
+    def _position(self, node):
+        """Return position of node's actor in self.actors"""
+        return self.index[node]
+
+    def distance_index(self, source=BACON_NUMBER):
+        """Return (levels, distances, parents) of a breadth-first search
+        from source
+
+        levels[n] is the frozenset of nodes at distance n (empty list if
+        source is not in the graph), distances is a bytearray of the
+        distance of every actor in self.actors (UNREACHABLE if there is no
+        path).  Distances which do not fit into a byte make it a list, with
+        None for no path.
+        parents is a memoryview of C ints of the position of the parent of
+        every actor in the shortest path tree (-1 for source and actors
+        which are not connected).
+        """
+        entry = self._distance_indexes.pop(source, None)
+        if entry is None:
+            node = self._node(source)
+            tree = {node: None}
+            levels = [] if node is None else _bfs_levels(self._adjacency(), node, parents=tree)
+            if len(levels) > UNREACHABLE:
+                distances = [None] * len(self.actors)
+            else:
+                distances = bytearray([UNREACHABLE]) * len(self.actors)
+            for n, level in enumerate(levels):
+                for node in level:
+                    distances[self._position(node)] = n
+            parents = memoryview(bytearray(b'\xff' * 4 * len(self.actors))).cast('i')
+            for node, parent in tree.items():
+                if parent is not None:
+                    parents[self._position(node)] = self._position(parent)
+            entry = (levels, distances, parents)
+            if self.cache_size < 1:
+                return entry
+            while self._distance_indexes and len(self._distance_indexes) >= self.cache_size:
+                del self._distance_indexes[next(iter(self._distance_indexes))]
+        self._distance_indexes[source] = entry
+        return entry
+
+    def actors_at_distance(self, n, source=BACON_NUMBER):
+        """Return set of actors at distance n from source"""
+        if n == 0:
+            return {source}
+        levels = self.distance_index(source)[0]
+        return set(self._actor_ids(levels[n])) if 0 < n < len(levels) else set()
+
+    def distance(self, actor_id, source=BACON_NUMBER):
+        """Return distance from source to actor, or None if not connected"""
+        if actor_id == source:
+            return 0
+        distances = self.distance_index(source)[1]
+        i = self.index.get(actor_id)
+        return None if i is None else _distance_at(distances, i)
+
+    def distance_histogram(self, source=BACON_NUMBER):
+        """Return list of numbers of actors at every distance from source"""
+        return [len(level) for level in self.distance_index(source)[0]] or [1]
+
+    def path_from(self, source, actor_id):
+        """Return shortest path from source to actor along the cached
+        shortest path tree of source, or None if not connected"""
+        if actor_id == source:
+            return [source]
+        _, distances, parents = self.distance_index(source)
+        i = self.index.get(actor_id)
+        if i is None or _distance_at(distances, i) is None:
+            return None
+        path = []
+        while i != -1:
+            path.append(self.actors[i])
+            i = parents[i]
+        return path[::-1]
+
+    def shortest_path_tree(self, source=BACON_NUMBER):
+        """Return dict of the parent of every actor connected to source on a
+        shortest path from it (None for source)"""
+        _, distances, parents = self.distance_index(source)
+        tree = {source: None}
+        for i, parent in enumerate(parents):
+            if parent != -1:
+                tree[self.actors[i]] = self.actors[parent]
+        return tree
+
+    def path(self, actor_id_1, actor_id_2):
+        """Return shortest path from actor_1 to actor_2, or None"""
+        if actor_id_2 == actor_id_1:
+            return [actor_id_1]
+        node_1, node_2 = self._node(actor_id_1), self._node(actor_id_2)
+        if node_1 is None or node_2 is None:
+            return None
+        path = _bidirectional_path(self._adjacency(), node_1, node_2)
+        return None if path is None else self._actor_ids(path)
+
+    def acted_together(self, actor_id_1, actor_id_2):
+        """Return True if actors acted in the same film, in O(1)"""
+        return actor_id_2 in self.neighbors.get(actor_id_1, ())
+
+    def movies_between(self, actor_id_1, actor_id_2):
+        """Return list of common movies of actors in data order"""
+        return self.movies.get(frozenset((actor_id_1, actor_id_2)), [])
+
+
+def _distance_at(distances, i):
+    """Return distance at position i of a distance_index array, or None if
+    there is no path"""
+    distance = distances[i]
+    if isinstance(distances, bytearray) and distance == UNREACHABLE:
+        return None
+    return distance
+
+
+def _int_array(size):
+    """Return memoryview of size zero C ints"""
+    return memoryview(bytearray(4 * size)).cast('i')
+
+
+def _int_copy(values):
+    """Return memoryview of C ints with a copy of values"""
+    if isinstance(values, memoryview):
+        return memoryview(bytearray(values)).cast('i')
+    result = _int_array(len(values))
+    for i, value in enumerate(values):
+        result[i] = value
+    return result
+
+
+class _TripleBuffer:
+    """Triples of ints in a growing array of C ints, which unlike an
+    iterator of triples can be iterated over many times"""
+
+    def __init__(self, triples):
+        self.size = 0
+        self.ints = _int_array(3 << 10)
+        for triple in triples:
+            if self.size == len(self.ints):
+                grown = _int_array(2 * self.size)
+                grown[:self.size] = self.ints
+                self.ints = grown
+            for value in triple:
+                self.ints[self.size] = value
+                self.size += 1
+
+    def __len__(self):
+        return self.size // 3
+
+    def __iter__(self):
+        values = iter(self.ints[:self.size])
+        return zip(values, values, values)
+
+
+class _SortedIndex:
+    """Read-only mapping of values of a sorted sequence to their positions"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, value, default=None):
+        values = self.values
+        lo, hi = 0, len(values)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if values[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(values) and values[lo] == value else default
+
+    def __getitem__(self, value):
+        i = self.get(value)
+        if i is None:
+            raise KeyError(value)
+        return i
+
+    def __contains__(self, value):
+        return self.get(value) is not None
+
+    def __len__(self):
+        return len(self.values)
+
+
+class CompactActorGraph(ActorGraph):
+    """ActorGraph in compressed sparse row form, for large databases
+
+    Actors are numbered by their position in actors, which is sorted.  The
+    neighbors of actor number i are targets[offsets[i]:offsets[i + 1]],
+    sorted, and edge_movies holds the movie of every such edge: a pair of
+    actors with several common movies has an edge per movie, in data order.
+    offsets, targets and edge_movies are memoryviews of C ints, so an edge
+    takes 16 bytes instead of the sets and pair index of ActorGraph.
+
+    neighbors and movies are built on demand, as they are not stored.
+    """
+
+    def __init__(self, data, names=None, movie_names=None, cache_size=8):
+        if iter(data) is data:
+            # two passes are needed, keep the triples of an iterator compact
+            data = _TripleBuffer(data)
+        degrees = {}
+        rank = {}
+        for id_1, id_2, movie in data:
+            rank.setdefault(movie, len(rank))
+            degrees[id_1] = degrees.get(id_1, 0) + 1
+            if id_2 != id_1:
+                degrees[id_2] = degrees.get(id_2, 0) + 1
+        self.actors = sorted(degrees)
+        self.index = {actor: i for i, actor in enumerate(self.actors)}
+        # fill rows with (neighbor, movie rank) edges, duplicates included
+        offsets = [0]
+        for actor in self.actors:
+            offsets.append(offsets[-1] + degrees[actor])
+        targets = _int_array(offsets[-1])
+        ranks = _int_array(offsets[-1])
+        cursor = offsets[:-1]
+        for id_1, id_2, movie in data:
+            i, j = self.index[id_1], self.index[id_2]
+            targets[cursor[i]], ranks[cursor[i]] = j, rank[movie]
+            cursor[i] += 1
+            if j != i:
+                targets[cursor[j]], ranks[cursor[j]] = i, rank[movie]
+                cursor[j] += 1
+        # sort every row and drop repeated edges, compacting in place
+        movies = list(rank)
+        size = 0
+        for i in range(len(self.actors)):
+            row = sorted(set(zip(targets[offsets[i]:offsets[i + 1]],
+                                 ranks[offsets[i]:offsets[i + 1]])))
+            offsets[i] = size
+            for target, movie in row:
+                targets[size], ranks[size] = target, movies[movie]
+                size += 1
+        offsets[-1] = size
+        self.offsets = _int_copy(offsets)
+        self.targets = _int_copy(targets[:size])
+        self.edge_movies = _int_copy(ranks[:size])
+        self._set_names(names, movie_names, cache_size)
+
+    @classmethod
+    def from_arrays(cls, actors, offsets, targets, edge_movies,
+                    names=None, movie_names=None, cache_size=8):
+        """Return graph of prebuilt arrays (e.g. memoryviews of a snapshot
+        file), without copying them.  actors must be sorted; they are looked
+        up by binary search instead of an index dict"""
+        graph = cls.__new__(cls)
+        graph.actors = actors
+        graph.index = _SortedIndex(actors)
+        graph.offsets = offsets
+        graph.targets = targets
+        graph.edge_movies = edge_movies
+        graph._set_names(names, movie_names, cache_size)
+        return graph
+
+    def get(self, node, default=()):
+        """Return memoryview of neighbor nodes of node"""
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def _adjacency(self):
+        return self
+
+    def _node(self, actor_id):
+        return self.index.get(actor_id)
+
+    def _actor_ids(self, nodes):
+        return [self.actors[node] for node in nodes]
+
+    def _position(self, node):
+        return node
+
+    def _edges(self, actor_id_1, actor_id_2):
+        """Return range of positions of edges from actor_1 to actor_2"""
+        i, j = self.index.get(actor_id_1), self.index.get(actor_id_2)
+        if i is None or j is None:
+            return range(0)
+        targets = self.targets
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if targets[mid] < j:
+                lo = mid + 1
+            else:
+                hi = mid
+        stop = lo
+        while stop < self.offsets[i + 1] and targets[stop] == j:
+            stop += 1
+        return range(lo, stop)
+
+    def acted_together(self, actor_id_1, actor_id_2):
+        """Return True if actors acted in the same film, in O(log degree)"""
+        return bool(self._edges(actor_id_1, actor_id_2))
+
+    def movies_between(self, actor_id_1, actor_id_2):
+        return [self.edge_movies[k] for k in self._edges(actor_id_1, actor_id_2)]
+
+    @property
+    def neighbors(self):
+        return {actor: set(self._actor_ids(self.get(i))) for i, actor in enumerate(self.actors)}
+
+    @property
+    def movies(self):
+        return {frozenset((actor, self.actors[self.targets[k]])):
+                self.movies_between(actor, self.actors[self.targets[k]])
+                for i, actor in enumerate(self.actors)
+                for k in range(self.offsets[i], self.offsets[i + 1])}
+
+
+def read_triples(fname, chunk_size=1 << 16):
+    """Yield [actor, actor, movie] triples of JSON database file one by one,
+    reading it chunk_size characters at a time"""
+    decoder = json.JSONDecoder()
+    with open(fname) as f:
+        buffer = ''
+        position = 0
+        started = finished = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer):
+                if not started:
+                    if buffer[position] != '[':
+                        raise ValueError('Expected JSON array in %r' % fname)
+                    started = True
+                    position += 1
+                    continue
+                if buffer[position] == ']':
+                    return
+                try:
+                    triple, position = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    # possibly cut by the end of the chunk
+                    if finished:
+                        raise
+                else:
+                    yield triple
+                    continue
+            elif finished:
+                raise ValueError('Unexpected end of %r' % fname)
+            chunk = f.read(chunk_size)
+            finished = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+
+def as_actor_graph(data):
+    """Return ActorGraph of raw data, or data itself if already built"""
+    return data if isinstance(data, ActorGraph) else ActorGraph(data)
 
 
 def did_x_and_y_act_together(data, actor_id_1, actor_id_2):
     """Return True if actors acted in the same film"""
+    if isinstance(data, ActorGraph):
+        return data.acted_together(actor_id_1, actor_id_2)
     return any(id_1 == actor_id_1 and id_2 == actor_id_2
                or id_1 == actor_id_2 and id_2 == actor_id_1
                for id_1, id_2, _ in data)
 
 
+def did_pairs_act_together(data, pairs):
+    """Return list of answers if (actor_1, actor_2) pairs acted together"""
+    graph = as_actor_graph(data)
+    return [graph.acted_together(actor_id_1, actor_id_2) for actor_id_1, actor_id_2 in pairs]
+
+
 def invert_dict(dict):
     """Create a new dictionary, where keys are dict.values and otherwise"""
     return {v: k for k, v in dict.items()}
@@ -24,6 +437,8 @@ def get_value(dict, key):
 
 def get_actor_graph(data):
     """Create a graph of actors by acting together"""
+    if isinstance(data, ActorGraph):
+        return data.neighbors
     actor_graph = {}
     for id1, id2, _ in data:
         actor_graph.setdefault(id1, set()).add(id2)
@@ -31,45 +446,118 @@ def get_actor_graph(data):
     return actor_graph
 
 
+def _bfs_levels(graph, source, limit=None, parents=None):
+    """Return list of frozensets of actors at every distance from source,
+    up to distance limit
+
+    parents, if given, is a dict of {source: None} which gets the parent of
+    every actor found.
+    """
+    levels = [frozenset((source,))]
+    closed = {source}
+    while limit is None or len(levels) <= limit:
+        fringe = set()
+        if parents is None:
+            for actor in levels[-1]:
+                fringe.update(graph.get(actor, ()))
+            fringe -= closed
+        else:
+            for actor in levels[-1]:
+                for child in graph.get(actor, ()):
+                    if child not in parents:
+                        parents[child] = actor
+                        fringe.add(child)
+        if not fringe:
+            break
+        closed |= fringe
+        levels.append(frozenset(fringe))
+    return levels
+
+
 def get_actors_with_bacon_number(data, n):
     """Return a set of actors with Bacon Number of n"""
-    result = {BACON_NUMBER}
-    closed = set()
-    graph = get_actor_graph(data)
-    for _ in range(n):
-        closed |= result
-        for i in result.copy():
-            result |= graph[i]
-        result -= closed
-        if not result:
-            break
-    return result
+    if isinstance(data, ActorGraph):
+        return data.actors_at_distance(n)
+    levels = _bfs_levels(get_actor_graph(data), BACON_NUMBER, n)
+    return set(levels[n]) if 0 <= n < len(levels) else set()
 
 
 def get_bacon_path(data, actor_id):
     """Return path from Bacon to actor"""
+    if isinstance(data, ActorGraph):
+        return data.path_from(BACON_NUMBER, actor_id)
     return get_path(data, BACON_NUMBER, actor_id)
 
 
+def get_shortest_path_tree(data, source=BACON_NUMBER):
+    """Return dict of the parent of every actor connected to source on a
+    shortest path from it (None for source)"""
+    if isinstance(data, ActorGraph):
+        return data.shortest_path_tree(source)
+    parents = {source: None}
+    _bfs_levels(get_actor_graph(data), source, parents=parents)
+    return parents
+
+
+def get_paths_from(data, source, targets):
+    """Return dict of paths from source to every target (None if not
+    connected), found by a single breadth-first search"""
+    if isinstance(data, ActorGraph):
+        return {target: data.path_from(source, target) for target in targets}
+    parents = get_shortest_path_tree(data, source)
+    return {target: _trace_parents(parents, target)[::-1] if target in parents else None
+            for target in targets}
+
+
 def get_path(data, actor_id_1, actor_id_2):
     """Return path from actor_1 to actor_2"""
-    graph = get_actor_graph(data)
-    fringe = {actor_id_1}
-    next_fringe = set()
-    paths = {actor_id_1: [actor_id_1]}
-    if actor_id_2 == actor_id_1:
-        return paths[actor_id_1]
-    while fringe:
-        for node in fringe:
-            children = graph[node]
-            if actor_id_2 in children:
-                return paths[node] + [actor_id_2]
-            for child in children:
-                if child not in paths:
-                    next_fringe.add(child)
-                    paths[child] = paths[node] + [child]
-        fringe = next_fringe
-        next_fringe = set()
+    if isinstance(data, ActorGraph):
+        return data.path(actor_id_1, actor_id_2)
+    return _bidirectional_path(get_actor_graph(data), actor_id_1, actor_id_2)
+
+
+def _bidirectional_path(graph, source, target):
+    """Return shortest path from source to target in graph, or None
+
+    Bidirectional breadth-first search: the smaller of the two fringes is
+    expanded by one level at a time, and the path is rebuilt from parent
+    pointers once the searches meet.
+    """
+    if target == source:
+        return [source]
+    parents = ({source: None}, {target: None})
+    depths = ({source: 0}, {target: 0})
+    fringes = [[source], [target]]
+    while fringes[0] and fringes[1]:
+        side = 0 if len(fringes[0]) <= len(fringes[1]) else 1
+        own_parents, own_depths = parents[side], depths[side]
+        other_depths = depths[1 - side]
+        meeting = None
+        next_fringe = []
+        for node in fringes[side]:
+            for child in graph.get(node, ()):
+                if child in other_depths:
+                    length = own_depths[node] + 1 + other_depths[child]
+                    if meeting is None or length < meeting[0]:
+                        meeting = (length, node, child)
+                elif child not in own_parents:
+                    own_parents[child] = node
+                    own_depths[child] = own_depths[node] + 1
+                    next_fringe.append(child)
+        if meeting is not None:
+            _, node, child = meeting
+            path = _trace_parents(own_parents, node)[::-1] + _trace_parents(parents[1 - side], child)
+            return path if side == 0 else path[::-1]
+        fringes[side] = next_fringe
+
+
+def _trace_parents(parents, node):
+    """Return path from node to the root of parent pointers"""
+    path = []
+    while node is not None:
+        path.append(node)
+        node = parents[node]
+    return path
 
 
 def get_movie_graph(data):
@@ -80,23 +568,21 @@ def get_movie_graph(data):
     return result
 
 
-def get_movie_path(data, actor_id_1, actor_id_2):
-    """Return movie path connected two actors"""
-    actor_path = get_path(data, actor_id_1, actor_id_2)
-    actor_pair = [frozenset(pair) for pair in zip(actor_path, actor_path[1:])]
-    movie_graph = get_movie_graph(data)
-    result = []
-    for pair in actor_pair:
-        for key, val in movie_graph.items():
-            if pair in val:
-                result.append(key)
-                break
-    return result
+def get_movie_path(data, actor_id_1, actor_id_2, all_movies=False):
+    """Return movie path connected two actors
+
+    With all_movies, every hop is the list of all movies connecting the pair.
+    """
+    graph = as_actor_graph(data)
+    actor_path = get_path(graph, actor_id_1, actor_id_2)
+    if actor_path is None:
+        return None
+    hops = [graph.movies_between(*pair) for pair in zip(actor_path, actor_path[1:])]
+    return hops if all_movies else [movies[0] for movies in hops]
 
 
 if __name__ == '__main__':
-    with open('resources/small.json') as f:
-        smalldb = json.load(f)
+    smalldb = ActorGraph(read_triples('resources/small.json'))
 
     # additional code here will be run only when lab.py is invoked directly
     # (not when imported from test.py), so this is a good place to put code
@@ -117,8 +603,7 @@ if __name__ == '__main__':
                                    get_value(names, "Christopher Showerman"),
                                    get_value(names, "Lew Knopp")))
 
-    with open('resources/large.json') as f:
-        largedb = json.load(f)
+    largedb = ActorGraph(read_triples('resources/large.json'))
 
     bacon_6 = ', '.join(get_value(ids, actor_id)
                         for actor_id in get_actors_with_bacon_number(largedb, 6))
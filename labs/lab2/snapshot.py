@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Binary snapshot of the actor database for fast loading
+
+A snapshot holds a prebuilt lab.CompactActorGraph: the sorted actor ids,
+the CSR offsets, neighbor numbers and edge movies as native C int arrays,
+followed by the names.json and movies.json maps as JSON.  Loading maps the
+file into memory and uses the arrays in place, so there is nothing to parse
+or build; the name maps are only decoded when asked for.
+
+File layout (all sections are 8-byte aligned):
+    HEADER: magic, version, byte order, number of actors, number of edges,
+            lengths of the names and movie names JSON
+    actors, offsets, targets, edge_movies, names JSON, movie names JSON
+
+Invoked as, for example:
+    python3 snapshot.py resources/large.json resources/large.snapshot \
+        --names resources/names.json --movies resources/movies.json
+"""
+
+import argparse
+import json
+import mmap
+import struct
+import sys
+
+import lab
+
+HEADER = struct.Struct('<4sHcxQQQQ')
+MAGIC = b'LSNP'
+VERSION = 1
+BYTE_ORDER = b'<' if sys.byteorder == 'little' else b'>'
+ALIGNMENT = 8
+
+
+def _padding(size):
+    return -size % ALIGNMENT
+
+
+def write_snapshot(fname, data, names=None, movie_names=None):
+    """
+    Write snapshot of raw [actor, actor, movie] triples (a list or an
+    iterator, e.g. lab.read_triples) or a lab.CompactActorGraph, with
+    optional name to id maps
+    """
+    graph = data if isinstance(data, lab.CompactActorGraph) else lab.CompactActorGraph(data)
+    names_json = json.dumps(names or {}).encode()
+    movies_json = json.dumps(movie_names or {}).encode()
+    arrays = (lab._int_copy(graph.actors), graph.offsets, graph.targets, graph.edge_movies)
+    with open(fname, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER, len(graph.actors), len(graph.targets),
+                            len(names_json), len(movies_json)))
+        f.write(bytes(_padding(HEADER.size)))
+        for section in arrays + (names_json, movies_json):
+            section = memoryview(section).cast('B')
+            f.write(section)
+            f.write(bytes(_padding(len(section))))
+
+
+def load_snapshot(fname, names=True, cache_size=8):
+    """
+    Return lab.CompactActorGraph of a snapshot file, whose arrays are
+    memory-mapped.  names=False skips decoding of the name maps
+    """
+    with open(fname, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mm)
+    try:
+        magic, version, byte_order, actors, edges, names_size, movies_size = \
+            HEADER.unpack_from(view)
+    except struct.error:
+        raise ValueError('Not a snapshot file: %r' % fname)
+    if magic != MAGIC:
+        raise ValueError('Not a snapshot file: %r' % fname)
+    if version != VERSION:
+        raise ValueError('Unsupported snapshot version: %d' % version)
+    if byte_order != BYTE_ORDER:
+        raise ValueError('Snapshot has a different byte order')
+
+    position = HEADER.size + _padding(HEADER.size)
+    sections = []
+    for size in (4 * actors, 4 * (actors + 1), 4 * edges, 4 * edges, names_size, movies_size):
+        if position + size > len(view):
+            raise ValueError('Truncated snapshot file: %r' % fname)
+        sections.append(view[position:position + size])
+        position += size + _padding(size)
+    arrays = [section.cast('i') for section in sections[:4]]
+    name_maps = [json.loads(bytes(section)) if names else None for section in sections[4:]]
+    graph = lab.CompactActorGraph.from_arrays(*arrays, *name_maps, cache_size=cache_size)
+    # keep the mapping open as long as the graph
+    graph._snapshot = mm
+    return graph
+
+
+def convert(source, target, names=None, movies=None):
+    """
+    Convert triples JSON file source (and names.json, movies.json files)
+    into snapshot file target
+    """
+    maps = []
+    for fname in (names, movies):
+        if fname is None:
+            maps.append(None)
+        else:
+            with open(fname) as f:
+                maps.append(json.load(f))
+    write_snapshot(target, lab.read_triples(source), *maps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('source', help='JSON file of [actor, actor, movie] triples')
+    parser.add_argument('target', help='snapshot file')
+    parser.add_argument('--names', help='JSON file mapping actor names to ids')
+    parser.add_argument('--movies', help='JSON file mapping movie names to ids')
+    args = parser.parse_args()
+    convert(args.source, args.target, args.names, args.movies)
+
+
+if __name__ == '__main__':
+    main()
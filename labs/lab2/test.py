@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 import os
+import benchmark
 import lab
 import json
+import snapshot
+import tempfile
 import unittest
 
 TEST_DIRECTORY = os.path.dirname(__file__)
@@ -269,6 +272,239 @@ class TestBaconPath(unittest.TestCase):
         self.assertEqual(result, expected)
 
 
+class TestActorGraph(unittest.TestCase):
+    def setUp(self):
+        """ Load actor/movie database """
+        with open('resources/small.json', 'r') as f:
+            self.data = json.load(f)
+        self.graph = lab.ActorGraph(self.data)
+
+    def test_01(self):
+        # prebuilt graph gives the same answers as the raw data
+        for actor1, actor2 in ((4724, 9210), (4724, 16935), (4724, 4724)):
+            self.assertEqual(lab.did_x_and_y_act_together(self.graph, actor1, actor2),
+                             lab.did_x_and_y_act_together(self.data, actor1, actor2))
+        for n in range(4):
+            self.assertEqual(lab.get_actors_with_bacon_number(self.graph, n),
+                             lab.get_actors_with_bacon_number(self.data, n))
+        self.assertEqual(lab.get_bacon_path(self.graph, 46866),
+                         lab.get_bacon_path(self.data, 46866))
+        self.assertIsNone(lab.get_bacon_path(self.graph, 2876669))
+
+    def test_02(self):
+        # movie path uses the first common movie in data order
+        path = lab.get_bacon_path(self.graph, 46866)
+        result = lab.get_movie_path(self.graph, 4724, 46866)
+        movie_graph = lab.get_movie_graph(self.data)
+        expected = [next(movie for movie, pairs in movie_graph.items()
+                         if frozenset(pair) in pairs)
+                    for pair in zip(path, path[1:])]
+        self.assertEqual(result, expected)
+        self.assertEqual(lab.get_movie_path(self.data, 4724, 46866), expected)
+        self.assertIsNone(lab.get_movie_path(self.graph, 4724, 2876669))
+
+    def test_03(self):
+        # name maps
+        names = {'Kevin Bacon': 4724}
+        graph = lab.ActorGraph(self.data, names, {'Apollo 13': 568})
+        self.assertEqual(graph.ids[4724], 'Kevin Bacon')
+        self.assertEqual(graph.movie_ids[568], 'Apollo 13')
+
+    def test_04(self):
+        # bulk pair queries
+        actors = sorted(self.graph.neighbors)[:60]
+        pairs = [(actor1, actor2) for actor1 in actors for actor2 in actors]
+        expected = [lab.did_x_and_y_act_together(self.data, actor1, actor2)
+                    for actor1, actor2 in pairs]
+        self.assertTrue(any(expected))
+        self.assertEqual(lab.did_pairs_act_together(self.graph, pairs), expected)
+        self.assertEqual(lab.did_pairs_act_together(self.data, pairs), expected)
+        self.assertEqual(lab.did_pairs_act_together(self.data, [(4724, 2876669)]), [False])
+
+    def test_05(self):
+        # all movies connecting every hop
+        path = lab.get_bacon_path(self.graph, 46866)
+        result = lab.get_movie_path(self.graph, 4724, 46866, all_movies=True)
+        movie_graph = lab.get_movie_graph(self.data)
+        expected = [[movie for movie, pairs in movie_graph.items() if frozenset(pair) in pairs]
+                    for pair in zip(path, path[1:])]
+        self.assertEqual(result, expected)
+        self.assertEqual(lab.get_movie_path(self.graph, 1640, 1532, all_movies=True),
+                         lab.get_movie_path(self.data, 1640, 1532, all_movies=True))
+        multiple = [pair for pair, movies in self.graph.movies.items() if len(movies) > 1]
+        self.assertTrue(multiple)
+        for pair in multiple:
+            self.assertEqual(self.graph.movies[pair],
+                             [movie for movie, pairs in movie_graph.items() if pair in pairs])
+
+    def test_06(self):
+        # bidirectional search finds paths as short as the single-source one
+        actors = sorted(self.graph.neighbors)
+        for actor1 in actors[::40]:
+            for actor2 in actors[::25] + [2876669]:
+                result = lab.get_path(self.graph, actor1, actor2)
+                expected = benchmark.single_source_path(self.graph, actor1, actor2)
+                if expected is None:
+                    self.assertIsNone(result)
+                    continue
+                self.assertEqual(len(result), len(expected))
+                self.assertEqual((result[0], result[-1]), (actor1, actor2))
+                self.assertTrue(valid_path(self.data, result))
+
+    def test_07(self):
+        # distance index, histogram and its cache of sources
+        histogram = self.graph.distance_histogram()
+        self.assertEqual(histogram[:4], [len(lab.get_actors_with_bacon_number(self.data, n))
+                                         for n in range(4)])
+        self.assertEqual(lab.get_actors_with_bacon_number(self.graph, len(histogram)), set())
+        for actor in (4724, 9210, 46866, 2876669):
+            path = lab.get_bacon_path(self.data, actor)
+            expected = None if path is None else len(path) - 1
+            self.assertEqual(self.graph.distance(actor), expected)
+        graph = lab.ActorGraph(self.data, cache_size=2)
+        for source in (4724, 9210, 4724, 46866):
+            self.assertEqual(graph.distance(9210, source),
+                             len(lab.get_path(self.data, source, 9210)) - 1)
+        self.assertEqual(list(graph._distance_indexes), [4724, 46866])
+        graph = lab.ActorGraph(self.data, cache_size=0)
+        self.assertEqual(graph.distance(9210), 1)
+        self.assertEqual(lab.get_bacon_path(graph, 9210), [4724, 9210])
+        self.assertEqual(graph._distance_indexes, {})
+
+    def test_08(self):
+        # compact graph answers as the dict based one
+        compact = lab.CompactActorGraph(self.data)
+        self.assertEqual(compact.neighbors, self.graph.neighbors)
+        self.assertEqual(compact.movies, self.graph.movies)
+        self.assertEqual(len(compact.targets), sum(map(len, self.graph.neighbors.values()))
+                         + sum(len(movies) - 1 for pair, movies in self.graph.movies.items()
+                               for _ in pair))
+        actors = sorted(self.graph.neighbors)[::15] + [2876669]
+        for actor1 in actors:
+            for actor2 in actors:
+                self.assertEqual(lab.did_x_and_y_act_together(compact, actor1, actor2),
+                                 lab.did_x_and_y_act_together(self.graph, actor1, actor2))
+                path = lab.get_path(compact, actor1, actor2)
+                expected = lab.get_path(self.graph, actor1, actor2)
+                if expected is None:
+                    self.assertIsNone(path)
+                    continue
+                self.assertEqual(len(path), len(expected))
+                self.assertTrue(valid_path(self.data, path))
+                self.assertEqual(lab.get_movie_path(compact, actor1, actor2, all_movies=True),
+                                 [self.graph.movies_between(*pair)
+                                  for pair in zip(path, path[1:])])
+        for n in range(-1, 6):
+            self.assertEqual(lab.get_actors_with_bacon_number(compact, n),
+                             lab.get_actors_with_bacon_number(self.data, n))
+        self.assertEqual(compact.distance_histogram(), self.graph.distance_histogram())
+
+    def test_09(self):
+        # paths to many targets from one cached search
+        actors = sorted(self.graph.neighbors)[::10] + [4724, 2876669]
+        for data in (self.data, self.graph, lab.CompactActorGraph(self.data)):
+            result = lab.get_paths_from(data, 4724, actors)
+            self.assertEqual(set(result), set(actors))
+            for actor in actors:
+                expected = lab.get_bacon_path(self.data, actor)
+                if expected is None:
+                    self.assertIsNone(result[actor])
+                    continue
+                self.assertEqual(len(result[actor]), len(expected))
+                self.assertEqual((result[actor][0], result[actor][-1]), (4724, actor))
+                self.assertTrue(valid_path(self.data, result[actor]))
+            tree = lab.get_shortest_path_tree(data, 4724)
+            self.assertEqual(set(tree), set().union(*(lab.get_actors_with_bacon_number(self.data, n)
+                                                      for n in range(10))))
+            self.assertIsNone(tree[4724])
+        graph = lab.ActorGraph(self.data, cache_size=1)
+        graph.path_from(4724, 46866)
+        entry = graph._distance_indexes[4724]
+        self.assertEqual(lab.get_bacon_path(graph, 9210), [4724, 9210])
+        self.assertIs(graph._distance_indexes[4724], entry)
+
+    def test_10(self):
+        # distances which do not fit into a byte
+        chain = [[4724 + i, 4725 + i, i] for i in range(300)]
+        for graph in (lab.ActorGraph(chain), lab.CompactActorGraph(chain)):
+            for n in (254, 255, 256, 300):
+                self.assertEqual(graph.distance(4724 + n), n)
+                path = lab.get_bacon_path(graph, 4724 + n)
+                self.assertEqual(path, lab.get_bacon_path(chain, 4724 + n))
+                self.assertEqual(len(path), n + 1)
+            self.assertIsNone(graph.distance(2876669))
+            self.assertIsNone(lab.get_bacon_path(graph, 2876669))
+            self.assertEqual(graph.distance_histogram(), [1] * 301)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        """ Load actor/movie database """
+        with open('resources/small.json', 'r') as f:
+            self.data = json.load(f)
+
+    def test_01(self):
+        # snapshot loads into the same graph
+        names = {'Kevin Bacon': 4724}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'small.snapshot')
+            snapshot.write_snapshot(fname, self.data, names)
+            graph = snapshot.load_snapshot(fname)
+            expected = lab.CompactActorGraph(self.data)
+            self.assertEqual(graph.neighbors, expected.neighbors)
+            self.assertEqual(graph.movies, expected.movies)
+            self.assertEqual(graph.names, names)
+            self.assertEqual(graph.movie_names, {})
+            self.assertEqual(lab.get_actors_with_bacon_number(graph, 2),
+                             lab.get_actors_with_bacon_number(self.data, 2))
+            self.assertEqual(len(lab.get_bacon_path(graph, 46866)), 4)
+            self.assertIsNone(lab.get_bacon_path(graph, 2876669))
+            self.assertIsNone(snapshot.load_snapshot(fname, names=False).names.get('Kevin Bacon'))
+
+    def test_02(self):
+        # invalid files
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'small.snapshot')
+            snapshot.write_snapshot(fname, self.data)
+            with open(fname, 'rb') as f:
+                content = bytearray(f.read())
+            content[4] += 1
+            with open(fname, 'wb') as f:
+                f.write(content)
+            self.assertRaises(ValueError, snapshot.load_snapshot, fname)
+            with open(fname, 'wb') as f:
+                f.write(b'LSNP')
+            self.assertRaises(ValueError, snapshot.load_snapshot, fname)
+
+
+class TestReadTriples(unittest.TestCase):
+    def test_01(self):
+        # streamed triples are the same as loaded ones, for any chunk size
+        with open('resources/small.json', 'r') as f:
+            data = json.load(f)
+        for chunk_size in (1, 10, 1 << 16):
+            self.assertEqual(list(lab.read_triples('resources/small.json', chunk_size)), data)
+        graph = lab.ActorGraph(lab.read_triples('resources/small.json'))
+        self.assertEqual(graph.neighbors, lab.get_actor_graph(data))
+        self.assertEqual(graph.movies, lab.ActorGraph(data).movies)
+        compact = lab.CompactActorGraph(lab.read_triples('resources/small.json', 100))
+        self.assertEqual(compact.neighbors, graph.neighbors)
+        self.assertEqual(compact.movies, graph.movies)
+
+    def test_02(self):
+        # invalid files
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'bad.json')
+            for content in ('{}', '[[1, 2, 3], [4, 5', '[[1, 2, 3],'):
+                with open(fname, 'w') as f:
+                    f.write(content)
+                with self.assertRaises(ValueError):
+                    list(lab.read_triples(fname, 4))
+            with open(fname, 'w') as f:
+                f.write(' [ ]\n')
+            self.assertEqual(list(lab.read_triples(fname)), [])
+
+
 def valid_path(d, p):
     x = {frozenset(i[:-1]) for i in d}
     return all(frozenset(i) in x for i in zip(p, p[1:]))
@@ -1,4 +1,4 @@
-import lab, json, traceback, time
+import lab, os, snapshot, traceback, time
 from importlib import reload
 reload(lab)  # this forces the student code to be reloaded when page is refreshed
 
@@ -9,19 +9,28 @@ def run_test(input_data):
     # Demux to the correct function
     try:
         if input_data["function"] == "pair":
-            result = lab.did_x_and_y_act_together(small_data, input_data["actor_1"], input_data["actor_2"])
+            result = lab.did_x_and_y_act_together(small_graph, input_data["actor_1"], input_data["actor_2"])
+
+        # Batch of [actor_1, actor_2] pairs
+        elif input_data["function"] == "pairs":
+            result = lab.did_pairs_act_together(small_graph, input_data["pairs"])
 
         # Actors with a given bacon number
         elif input_data["function"] == "set":
-            result = lab.get_actors_with_bacon_number(small_data, input_data["n"])
+            result = lab.get_actors_with_bacon_number(small_graph, input_data["n"])
 
         # Paths in a small database
         elif input_data["function"] == "path_small":
-            result = lab.get_bacon_path(small_data, input_data["actor_id"])
+            result = lab.get_bacon_path(small_graph, input_data["actor_id"])
 
         # Paths in a large database
         elif input_data["function"] == "path":
-            result = lab.get_bacon_path(large_data, input_data["actor_id"])
+            result = lab.get_bacon_path(large_graph, input_data["actor_id"])
+
+        # Paths to many actors in a large database, by one search
+        elif input_data["function"] == "paths":
+            paths = lab.get_paths_from(large_graph, lab.BACON_NUMBER, input_data["actor_ids"])
+            result = [paths[actor_id] for actor_id in input_data["actor_ids"]]
 
         running_time = time.time() - running_time
 
@@ -33,29 +42,33 @@ def run_test(input_data):
 
 # These functions are required by the UI
 def better_together(d):
-    return lab.did_x_and_y_act_together(small_data, d["actor_1"], d["actor_2"])
+    return lab.did_x_and_y_act_together(small_graph, d["actor_1"], d["actor_2"])
 
 
 def bacon_number(d):
-    return list(lab.get_actors_with_bacon_number(small_data, d["n"]))
+    return list(lab.get_actors_with_bacon_number(small_graph, d["n"]))
 
 
 def bacon_path(d):
-    return lab.get_bacon_path(small_data, d["actor_name"])
+    return lab.get_bacon_path(small_graph, d["actor_name"])
 
 
-# State that is used by both ui and test code
-small_data = None
-large_data = None
+# State that is used by both ui and test code: lab.ActorGraph of the
+# databases, built once; their triples are streamed in and not kept
+small_graph = None
+large_graph = None
+# snapshot of the large database (see snapshot.py), used instead of the JSON
+LARGE_SNAPSHOT = './resources/large.snapshot'
 
 
 ## Initialization
 def init():
-    global small_data
-    global large_data
-    with open('./resources/small.json', 'r') as f:
-            small_data = json.load(f)
-    with open('./resources/large.json', 'r') as f:
-            large_data = json.load(f)
+    global small_graph
+    global large_graph
+    small_graph = lab.ActorGraph(lab.read_triples('./resources/small.json'))
+    if os.path.exists(LARGE_SNAPSHOT):
+        large_graph = snapshot.load_snapshot(LARGE_SNAPSHOT, names=False)
+    else:
+        large_graph = lab.ActorGraph(lab.read_triples('./resources/large.json'))
 
 init()